@@ -1,17 +1,22 @@
 # app.py
+import uuid
 import streamlit as st
 
 # Importaciones limpias y centralizadas desde el paquete 'utils'
 # Este archivo ahora solo se encarga de la interfaz y la orquestación.
-from utils import agent_logic
-from utils.app_utils import load_rag_chain, check_index_exists
+from utils import agent_logic, chat_history, config, corpora
+from utils.app_utils import load_rag_index, reload_rag_index, check_index_exists, answer_question, execute_file_search_tool, execute_list_files_in_folder_tool
+from utils.model_calls import ModelBusyError
+from utils.pipeline import ChatPipeline
 from utils.processing import process_and_upload_index
 
 # --- Inicialización del Estado de la Aplicación ---
 # Esta sección se mantiene igual, ya que es una buena práctica.
+if 'corpus' not in st.session_state:
+    st.session_state.corpus = config.DEFAULT_CORPUS
 if 'index_ready' not in st.session_state:
-    # Al iniciar, comprueba si el índice ya existe en GCS para no tener que procesar
-    st.session_state.index_ready = check_index_exists()
+    # Por corpus: al elegir uno se comprueba si su índice ya existe en GCS para no tener que procesar
+    st.session_state.index_ready = {}
 
 st.set_page_config(page_title="Agente Inteligente", layout="wide")
 st.title("🤖 Agente Inteligente de Documentos")
@@ -20,117 +25,191 @@ st.title("🤖 Agente Inteligente de Documentos")
 # La lógica del sidebar también se mantiene, es robusta.
 with st.sidebar:
     st.header("Gestión de Documentos")
+    st.selectbox("Corpus de documentos", corpora.list_corpora(), key="corpus")
+    corpus = st.session_state.corpus
+    if corpus not in st.session_state.index_ready:
+        st.session_state.index_ready[corpus] = check_index_exists(corpus)
+
     if st.button("Procesar y Actualizar PDFs", type="primary", use_container_width=True):
         with st.status("Actualizando índice de documentos...", expanded=True) as status:
-            # Limpiamos el caché de recursos para forzar una recarga del índice si se vuelve a crear
-            st.cache_resource.clear()
-            success, message = process_and_upload_index(status)
+            success, message = process_and_upload_index(status, corpus)
             if success:
-                st.session_state.index_ready = True
+                st.session_state.index_ready[corpus] = True
+                # Cargamos el nuevo índice y calentamos sus cachés antes de volver al chat;
+                # mientras tanto, las demás sesiones siguen usando la versión anterior
+                status.update(label="Cargando el índice y calentando las cachés...", state="running")
+                reload_rag_index(corpus)
                 st.success(message)
                 st.rerun() # Recarga la app para reflejar el nuevo estado
             else:
                 st.error(message)
 
-    if st.session_state.index_ready:
+    if st.session_state.index_ready[corpus]:
         st.success("✅ El índice de búsqueda está listo.")
     else:
         st.warning("⚠️ El índice de búsqueda no está disponible. Púlsalo para habilitar la búsqueda de información en PDFs.")
 
 # --- Lógica Principal del Chat ---
-# La gestión del historial de mensajes es correcta.
-if "messages" not in st.session_state:
-    st.session_state.messages = []
-
-for message in st.session_state.messages:
-    with st.chat_message(message["role"]):
-        # Manejo especial para mostrar la imagen si existe en el historial
-        if message.get("type") == "image":
-            st.image(message["image_url"], caption=message["caption"])
-        else:
-            st.markdown(message["content"])
+BUSY_MESSAGE = "El asistente está atendiendo muchas solicitudes ahora mismo. Por favor, inténtalo de nuevo en unos segundos."
+TOOL_SPINNER_LABELS = {
+    "find_specific_file": "Buscando el archivo en GCS...",
+    "list_files_in_folder": "Listando archivos en la carpeta...",
+    "search_knowledge_base": "Buscando en la documentación...",
+}
+# El historial visible está acotado; los mensajes antiguos se vuelcan a disco (ver utils/chat_history.py).
+# Cada clave se inicializa por separado: otro módulo puede haber creado ya alguna (p.ej. "messages")
+if "session_id" not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
+    # Cada sesión nueva aprovecha para borrar los volcados de sesiones inactivas
+    chat_history.sweep_stale()
+SESSION_DEFAULTS = {
+    "messages": list,
+    "message_seq": lambda: 0,
+    "spilled_count": lambda: 0,
+    # Ventana de mensajes antiguos cargados a demanda: como mucho una página, empezando en older_start
+    "older_messages": list,
+    "older_start": lambda: 0,
+}
+for key, default in SESSION_DEFAULTS.items():
+    if key not in st.session_state:
+        st.session_state[key] = default()
+
+def add_message(message):
+    """Añade un mensaje al historial con un id estable (usado en las keys de los widgets)."""
+    st.session_state.message_seq += 1
+    message["id"] = st.session_state.message_seq
+    st.session_state.messages.append(message)
+    return message
+
+def result_to_message(result):
+    """Convierte el resultado de una herramienta en un mensaje del historial."""
+    if result["type"] == "image":
+        # Guardamos la vista previa (no el original) para los reruns del historial
+        return {
+            "role": "assistant",
+            "content": f"Aquí tienes la imagen: {result['caption']}",
+            "type": "image",
+            "image_url": result['content'],
+            "original_url": result.get('original_url'),
+            "caption": result['caption']
+        }
+    # Guardamos el resultado completo (p.ej. para conservar el token de la página siguiente)
+    return {"role": "assistant", **result}
+
+def answer_from_index(question):
+    """Etapa RAG del pipeline: responde con el índice si está disponible."""
+    corpus = st.session_state.corpus
+    if not st.session_state.index_ready.get(corpus):
+        return {"type": "warning", "content": "La búsqueda de información no está disponible. Por favor, procesa los PDFs primero desde la barra lateral."}
+    loaded = load_rag_index(corpus)
+    # --- CORRECCIÓN: AÑADIMOS ESTA COMPROBACIÓN DE SEGURIDAD ---
+    if loaded is None:
+        return {"type": "error", "content": "Error: No se pudo cargar la base de conocimiento (índice RAG). Esto puede ocurrir si el proceso de indexación falló. Por favor, intenta 'Procesar y Actualizar PDFs' de nuevo desde la barra lateral."}
+    return {"type": "message", "content": answer_question(loaded.chain, question, corpus=corpus, version=loaded.version)}
+
+def render_message(message):
+    # Manejo especial para mostrar la imagen si existe en el historial
+    if message.get("type") == "image":
+        st.image(message["image_url"], caption=message["caption"])
+        if message.get("original_url"):
+            st.markdown(f"[Ver imagen original]({message['original_url']})")
+    elif message.get("type") == "error":
+        st.error(message["content"])
+    elif message.get("type") == "warning":
+        st.warning(message["content"])
+    else:
+        st.markdown(message["content"])
+
+def render_load_more(message):
+    """
+    Muestra el botón "Cargar más" de un listado paginado. Al pulsarlo se pide la
+    siguiente página y se añade como un mensaje nuevo del historial.
+    """
+    if not message.get("next_page_token"):
+        return
+    if st.button("Cargar más archivos", key=f"load_more_{message['id']}"):
+        with st.spinner("Cargando más archivos..."):
+            # El listado sigue en su corpus aunque la sesión haya cambiado de corpus después
+            result = execute_list_files_in_folder_tool(
+                {"folder_name": message["folder_name"]}, page_token=message["next_page_token"],
+                corpus_name=message.get("corpus"),
+            )
+        # El token ya se consumió: este mensaje deja de mostrar el botón.
+        # El bucle del historial recorre también el mensaje recién añadido.
+        message["next_page_token"] = None
+        add_message(result_to_message(result))
+
+@st.fragment
+def render_history():
+    """
+    Pinta el historial como fragmento: los botones de dentro ("Cargar más",
+    "Mostrar mensajes anteriores") solo vuelven a ejecutar esta función.
+    """
+    pending = st.session_state.older_start
+    if pending > 0 and st.button(f"Mostrar mensajes anteriores ({pending})", key="load_older"):
+        # La página anterior sustituye a la ventana cargada: la sesión nunca guarda más de una página antigua
+        start = max(0, pending - config.CHAT_HISTORY_MAX_MESSAGES)
+        st.session_state.older_messages = chat_history.load_spilled(st.session_state.session_id, start, pending)
+        st.session_state.older_start = start
+
+    older = st.session_state.older_messages
+    hidden = st.session_state.spilled_count - st.session_state.older_start - len(older)
+    if older and hidden > 0:
+        st.caption(f"… {hidden} mensajes posteriores no mostrados …")
+        if st.button("Volver a los mensajes recientes", key="reset_older"):
+            st.session_state.older_messages = []
+            st.session_state.older_start = st.session_state.spilled_count
+            older = []
+
+    for message in older:
+        with st.chat_message(message["role"]):
+            render_message(message)
+
+    for message in st.session_state.messages:
+        with st.chat_message(message["role"]):
+            render_message(message)
+            render_load_more(message)
+
+# Volcamos el exceso al inicio de cada ejecución, antes de pintar, para no
+# modificar la lista mientras el historial la recorre
+spilled_now = chat_history.trim_history(st.session_state.messages, st.session_state.session_id)
+if spilled_now:
+    st.session_state.spilled_count += spilled_now
+    # Los mensajes antiguos cargados ya no son contiguos con el historial visible
+    st.session_state.older_messages = []
+    st.session_state.older_start = st.session_state.spilled_count
+render_history()
 
 # Entrada de texto del usuario
 if query := st.chat_input("Pide información o solicita un archivo..."):
-    st.session_state.messages.append({"role": "user", "content": query})
+    add_message({"role": "user", "content": query})
     with st.chat_message("user"):
         st.markdown(query)
 
     with st.chat_message("assistant"):
+        pipeline = ChatPipeline(
+            route=agent_logic.get_agent_decision,
+            find_file=lambda details: execute_file_search_tool(details, corpus_name=st.session_state.corpus),
+            list_files=lambda details: execute_list_files_in_folder_tool(details, corpus_name=st.session_state.corpus),
+            answer=answer_from_index,
+        )
         with st.spinner("Analizando tu solicitud..."):
             # 1. El agente decide la intención usando la lógica mejorada
-            decision = agent_logic.get_agent_decision(query)
+            try:
+                decision = pipeline.route(query)
+            except ModelBusyError:
+                render_message(add_message({"role": "assistant", "type": "warning", "content": BUSY_MESSAGE}))
+                st.stop()
             # Este log es muy útil para depuración
             st.write(f"_(Intención detectada: {decision.get('intencion')})_")
 
         # 2. Ejecutar la herramienta correspondiente según la decisión del agente
-        intention = decision.get("intencion")
-
-        # CAMBIO: Usamos la nueva intención 'find_specific_file'
-        if intention == 'find_specific_file':
-            with st.spinner("Buscando el archivo en GCS..."):
-                # CAMBIO: Usamos la nueva función de herramienta 'execute_file_search_tool'
-                result = agent_logic.execute_file_search_tool(decision.get('detalles', {}))
-                
-                # La lógica para mostrar el resultado es robusta y se mantiene
-                if result['type'] == 'error':
-                    response_content = result['content']
-                    st.error(response_content)
-                elif result['type'] == 'message':
-                    response_content = result['content']
-                    st.markdown(response_content)
-                elif result['type'] == 'link':
-                    response_content = result['content']
-                    st.markdown(response_content)
-                elif result['type'] == 'image':
-                    # Para las imágenes, el contenido es la URL y se muestra directamente
-                    st.image(result['content'], caption=result['caption'])
-                    # Guardamos la información de la imagen en el historial
-                    st.session_state.messages.append({
-                        "role": "assistant",
-                        "content": f"Aquí tienes la imagen: {result['caption']}",
-                        "type": "image",
-                        "image_url": result['content'],
-                        "caption": result['caption']
-                    })
-                    # Salimos del `if` para no añadir un mensaje duplicado
-                    
-
-                # Para todos los tipos que no son imagen, guardamos el texto en el historial
-                st.session_state.messages.append({"role": "assistant", "content": response_content})
-        elif intention == 'list_files_in_folder': # NUEVA INTENCIÓN
-            with st.spinner("Listando archivos en la carpeta..."):
-                result = agent_logic.execute_list_files_in_folder_tool(decision.get('detalles', {}))
-                if result['type'] == 'error':
-                    st.error(result['content'])
-                    st.session_state.messages.append({"role": "assistant", "content": result['content']})
-                else:
-                    st.markdown(result['content'])
-                    st.session_state.messages.append({"role": "assistant", "content": result['content']})
-
-        # CAMBIO: Usamos la nueva intención 'search_knowledge_base'
-        elif intention == 'search_knowledge_base':
-            if not st.session_state.index_ready:
-                response = "La búsqueda de información no está disponible. Por favor, procesa los PDFs primero desde la barra lateral."
-                st.warning(response)
-                st.session_state.messages.append({"role": "assistant", "content": response})
-            else:
-                with st.spinner("Buscando en la documentación..."):
-                    rag_chain = load_rag_chain()
-                    # --- CORRECCIÓN: AÑADIMOS ESTA COMPROBACIÓN DE SEGURIDAD ---
-                    if rag_chain is None:
-                        response = "Error: No se pudo cargar la base de conocimiento (índice RAG). Esto puede ocurrir si el proceso de indexación falló. Por favor, intenta 'Procesar y Actualizar PDFs' de nuevo desde la barra lateral."
-                        st.error(response)
-                        st.session_state.messages.append({"role": "assistant", "content": response})
-                    else:
-                        # Este código ahora solo se ejecuta si rag_chain es un objeto válido
-                        question_to_ask = decision.get("detalles", {}).get("question", query)
-                        response = rag_chain.invoke(question_to_ask)
-                        st.markdown(response)
-                        st.session_state.messages.append({"role": "assistant", "content": response})
-        
-        else:
-            response = "Lo siento, no he podido entender tu solicitud. ¿Puedes reformularla?"
-            st.markdown(response)
-            st.session_state.messages.append({"role": "assistant", "content": response})
-            
\ No newline at end of file
+        with st.spinner(TOOL_SPINNER_LABELS.get(decision.get("intencion"), "Procesando tu solicitud...")):
+            try:
+                result = pipeline.run_tool(decision, query)
+            except ModelBusyError:
+                result = {"type": "warning", "content": BUSY_MESSAGE}
+
+        message = add_message(result_to_message(result))
+        render_message(message)
+        render_load_more(message)
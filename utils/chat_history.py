@@ -0,0 +1,80 @@
+# chat_history.py
+"""
+Historial de chat acotado por sesión.
+
+`st.session_state.messages` solo conserva los últimos
+`config.CHAT_HISTORY_MAX_MESSAGES` mensajes. Los más antiguos se vuelcan a un
+archivo JSON-lines por sesión y solo se leen cuando el usuario pide verlos,
+así que la memoria y el coste de cada rerun no crecen con la duración de la sesión.
+Los archivos de sesiones inactivas se borran con `sweep_stale`.
+"""
+import json
+import os
+import time
+
+from . import config
+
+
+def spill_path(session_id):
+    return os.path.join(config.CHAT_HISTORY_SPILL_DIR, f"{session_id}.jsonl")
+
+
+def trim_history(messages, session_id, max_messages=None):
+    """
+    Vuelca al archivo de la sesión los mensajes que sobran por el principio.
+    Modifica `messages` en el sitio y devuelve cuántos mensajes se volcaron.
+    """
+    max_messages = max_messages or config.CHAT_HISTORY_MAX_MESSAGES
+    overflow = len(messages) - max_messages
+    if overflow <= 0:
+        return 0
+
+    os.makedirs(config.CHAT_HISTORY_SPILL_DIR, exist_ok=True)
+    with open(spill_path(session_id), "a", encoding="utf-8") as f:
+        for message in messages[:overflow]:
+            # Un listado volcado ya no puede pedir más páginas desde el historial
+            message = {**message, "next_page_token": None} if message.get("next_page_token") else message
+            f.write(json.dumps(message, ensure_ascii=False) + "\n")
+    del messages[:overflow]
+    return overflow
+
+
+def load_spilled(session_id, start, end):
+    """Lee los mensajes volcados en las posiciones [start, end) (0 = el más antiguo)."""
+    path = spill_path(session_id)
+    if not os.path.exists(path):
+        return []
+    loaded = []
+    with open(path, encoding="utf-8") as f:
+        for position, line in enumerate(f):
+            if position >= end:
+                break
+            if position >= start:
+                loaded.append(json.loads(line))
+    return loaded
+
+
+def delete_spilled(session_id):
+    path = spill_path(session_id)
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def sweep_stale(max_age_hours=None):
+    """Borra los volcados que no se han modificado en `max_age_hours`. Devuelve cuántos se borraron."""
+    max_age_hours = max_age_hours or config.CHAT_HISTORY_SPILL_TTL_HOURS
+    if not os.path.isdir(config.CHAT_HISTORY_SPILL_DIR):
+        return 0
+    cutoff = time.time() - max_age_hours * 3600
+    removed = 0
+    for filename in os.listdir(config.CHAT_HISTORY_SPILL_DIR):
+        if not filename.endswith(".jsonl"):
+            continue
+        try:
+            if os.path.getmtime(os.path.join(config.CHAT_HISTORY_SPILL_DIR, filename)) < cutoff:
+                delete_spilled(filename[:-len(".jsonl")])
+                removed += 1
+        except FileNotFoundError:
+            # Otra sesión lo ha borrado a la vez
+            continue
+    return removed
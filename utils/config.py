@@ -1,3 +1,5 @@
+import os
+import tempfile
 
 PROJECT_ID = "kyndryl-datalake"
 LOCATION = "us-central1"
@@ -14,6 +16,16 @@ PROCESSED_FILES_MANIFEST = "manifest.json"
 # Nuevas rutas para el índice y JSONs GLOBALES
 GLOBAL_JSON_GCS_FOLDER = f"{ROOT_GCS_FOLDER}processed_json_global/"
 FAISS_INDEX_GCS_FOLDER = f"{ROOT_GCS_FOLDER}faiss_index_global/"
+# Carpeta donde cada worker del job de indexación distribuida deja su shard parcial
+FAISS_SHARDS_GCS_FOLDER = f"{ROOT_GCS_FOLDER}faiss_index_shards/"
+# Miniaturas y vistas previas generadas a partir de las imágenes originales
+THUMBNAIL_GCS_FOLDER = f"{ROOT_GCS_FOLDER}thumbnails/"
+# Registro anónimo de frecuencia de preguntas (para calentar cachés)
+QUERY_LOG_GCS_FOLDER = f"{ROOT_GCS_FOLDER}query_log/"
+
+# Parámetros de fragmentación compartidos por todos los indexadores
+CHUNK_SIZE = 1500
+CHUNK_OVERLAP = 150
 
 # Modelos a usar (Vertex AI model names)
 PDF_EXTRACTION_LLM = "gemini-2.0-flash-lite-001" 
@@ -24,7 +36,9 @@ ROUTING_LLM_CONFIG = {
     "model_name": "gemini-2.0-flash-lite-001",
     "project": PROJECT_ID,
     "location": LOCATION,
-    "temperature": 0.1
+    "temperature": 0.1,
+    # Salida JSON forzada por el modelo: evita fences y texto extra alrededor
+    "response_mime_type": "application/json"
 }
 EMBEDDING_MODEL_CONFIG = {
     "model_name": "text-embedding-004",
@@ -42,3 +56,95 @@ SEARCHABLE_FILE_FOLDERS = [
     f"{ROOT_GCS_FOLDER}Correctivo/",
     f"{ROOT_GCS_FOLDER}Preventivo/"
 ]
+
+# Paginación de los listados de carpetas
+FOLDER_LISTING_PAGE_SIZE = 25
+FOLDER_LISTING_MAX_PAGE_SIZE = 100
+
+# Derivados de imágenes: lado mayor en píxeles de cada variante
+THUMBNAIL_VARIANTS = {
+    "thumb": 256,
+    "preview": 800
+}
+# Variante que se muestra en el chat (el original queda detrás de un enlace)
+CHAT_IMAGE_VARIANT = "preview"
+THUMBNAIL_JPEG_QUALITY = 80
+THUMBNAIL_LOCAL_CACHE_DIR = os.path.join(tempfile.gettempdir(), "agent_thumbnails")
+# Tamaño máximo de la caché local (en Cloud Run /tmp ocupa memoria): al superarlo se borran los menos usados
+THUMBNAIL_LOCAL_CACHE_MAX_BYTES = 100 * 1024 * 1024
+
+# Ensamblado del contexto RAG
+RAG_RETRIEVER_K = 5
+RAG_CONTEXT_TOKEN_BUDGET = 900
+RAG_MAX_SENTENCES_PER_CHUNK = 4
+# Aproximación de caracteres por token para estimar sin llamar al modelo
+CHARS_PER_TOKEN = 4
+
+# Historial de chat: mensajes que se mantienen en memoria por sesión;
+# el resto se vuelca a disco y se carga bajo demanda
+CHAT_HISTORY_MAX_MESSAGES = 40
+CHAT_HISTORY_SPILL_DIR = os.path.join(tempfile.gettempdir(), "agent_chat_history")
+# Los volcados de sesiones sin actividad durante este tiempo se borran (Streamlit no avisa del fin de sesión)
+CHAT_HISTORY_SPILL_TTL_HOURS = 24
+
+# Micro-batching de consultas entre sesiones (embeddings + búsqueda FAISS)
+QUERY_BATCH_MAX_WAIT_MS = 5
+QUERY_BATCH_MAX_SIZE = 32
+
+# Enrutado: número de ejemplos few-shot por consulta y caché del índice de ejemplos
+ROUTING_NUM_EXAMPLES = 3
+ROUTING_EXAMPLE_INDEX_DIR = os.path.join(tempfile.gettempdir(), "agent_routing")
+# Embeddings de consultas ya enrutadas, para no pagar otra llamada antes del LLM al repetirse
+ROUTING_QUERY_CACHE_SIZE = 2000
+
+# Concurrencia máxima de llamadas en curso por modelo dentro de cada proceso
+MODEL_MAX_CONCURRENCY = {
+    "gemini-2.0-flash-lite-001": 8,
+    "text-embedding-004": 16
+}
+MODEL_DEFAULT_MAX_CONCURRENCY = 8
+# Espera máxima en cola por un hueco libre y por el resultado de una petición coalescida
+MODEL_QUEUE_TIMEOUT_S = 20
+MODEL_CALL_TIMEOUT_S = 60
+# Duración máxima de la llamada de embeddings de un lote del batcher
+EMBEDDING_CALL_TIMEOUT_S = 10
+# Espera máxima de una búsqueda por su lote: cubre la cola del modelo más la llamada acotada
+QUERY_BATCH_TIMEOUT_S = MODEL_QUEUE_TIMEOUT_S + EMBEDDING_CALL_TIMEOUT_S + 5
+
+# Artefactos del índice: partes comprimidas con zstd y transferidas en paralelo
+INDEX_ARTIFACTS_MANIFEST = "index_artifacts.json"
+INDEX_PART_SIZE_BYTES = 32 * 1024 * 1024
+INDEX_ZSTD_LEVEL = 3
+INDEX_TRANSFER_WORKERS = 8
+# Versiones de partes que se conservan en GCS (la publicada y las anteriores más recientes)
+INDEX_KEEP_VERSIONS = 2
+# Cada cuánto comprueba una instancia si se ha publicado otra versión del índice que tiene cargado
+INDEX_VERSION_CHECK_INTERVAL_S = 60
+
+# Cachés de respuestas y de embeddings de consultas, y su calentamiento
+ANSWER_CACHE_SIZE = 500
+EMBEDDING_CACHE_SIZE = 2000
+CACHE_WARM_TOP_N = 25
+CACHE_WARM_WORKERS = 4
+QUERY_LOG_FLUSH_EVERY = 20
+QUERY_LOG_FLUSH_INTERVAL_S = 300
+QUERY_LOG_MAX_QUESTION_CHARS = 300
+
+# --- Corpus (sitios) ---
+# Cada corpus tiene su propio árbol de documentos, índice y manifiesto.
+# Son obligatorios "bucket", "root_folder" y "searchable_folders"; el resto se deriva de root_folder.
+CORPORA = {
+    "infinitydelta": {
+        "bucket": BUCKET_NAME,
+        "root_folder": ROOT_GCS_FOLDER,
+        "index_folder": FAISS_INDEX_GCS_FOLDER,
+        "image_folder": IMAGE_FOLDER_PREFIX,
+        "extraction_folder": GLOBAL_JSON_GCS_FOLDER,
+        "shards_folder": FAISS_SHARDS_GCS_FOLDER,
+        "thumbnail_folder": THUMBNAIL_GCS_FOLDER,
+        "searchable_folders": SEARCHABLE_FILE_FOLDERS
+    }
+}
+DEFAULT_CORPUS = "infinitydelta"
+# Memoria máxima (estimada) para los índices cargados a la vez; los menos usados se descargan
+INDEX_MEMORY_BUDGET_BYTES = 2 * 1024 * 1024 * 1024
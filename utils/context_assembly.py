@@ -0,0 +1,131 @@
+# context_assembly.py
+"""
+Ensamblado del CONTEXTO del prompt RAG con presupuesto de tokens.
+
+En lugar de volcar los fragmentos recuperados tal cual (con el repr de los
+Document de LangChain y metadatos repetidos), se quitan las frases duplicadas
+por el solapamiento entre fragmentos, se conservan solo las frases relacionadas
+con la pregunta y se formatea cada fuente en una línea compacta:
+    [1] manual_bomba.pdf p.4: frase relevante. Otra frase relevante.
+"""
+import os
+import re
+import unicodedata
+
+from . import config
+
+# Palabras vacías en español que no aportan a la relevancia de una frase
+STOPWORDS = {
+    "a", "al", "algo", "como", "con", "cual", "cuales", "cuando", "de", "del", "donde", "el", "ella",
+    "en", "es", "esta", "este", "esto", "hay", "la", "las", "le", "lo", "los", "me", "mi", "mas",
+    "no", "o", "para", "pero", "por", "que", "quien", "se", "si", "sin", "sobre", "son", "su", "sus",
+    "tiene", "un", "una", "uno", "y", "ya", "hacer", "puedo", "debo", "necesito", "quiero",
+}
+
+# Por debajo de este tamaño, una frase recortada no aporta nada útil al modelo
+MIN_TRUNCATED_CHARS = 40
+
+_SENTENCE_SPLIT_RE = re.compile(r"(?<=[.!?])\s+|\n\s*\n")
+_WORD_RE = re.compile(r"\w+")
+
+
+def estimate_tokens(text):
+    """Estimación barata de tokens (sin llamar al modelo) a partir del número de caracteres."""
+    return max(1, len(text) // config.CHARS_PER_TOKEN) if text else 0
+
+
+def _normalize(text):
+    text = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+
+def query_terms(question):
+    return {w for w in _WORD_RE.findall(_normalize(question)) if len(w) > 2 and w not in STOPWORDS}
+
+
+def split_sentences(text):
+    # Los saltos de línea simples de PyMuPDF suelen cortar frases: los tratamos como espacios
+    text = re.sub(r"[ \t]*\n(?!\s*\n)[ \t]*", " ", text)
+    return [s.strip() for s in _SENTENCE_SPLIT_RE.split(text) if len(s.strip()) > 2]
+
+
+def select_relevant_sentences(sentences, terms, max_sentences):
+    """Elige las frases con más términos de la pregunta, manteniendo su orden original."""
+    scored = []
+    for position, sentence in enumerate(sentences):
+        words = set(_WORD_RE.findall(_normalize(sentence)))
+        score = len(terms & words)
+        if score:
+            scored.append((score, position))
+    best = sorted(scored, key=lambda item: (-item[0], item[1]))[:max_sentences]
+    return [sentences[position] for _, position in sorted(best, key=lambda item: item[1])]
+
+
+def truncate_to_tokens(prefix, sentence, max_tokens):
+    """Recorta `sentence` por una palabra para que `prefix + sentence` quepa en `max_tokens`."""
+    max_chars = max_tokens * config.CHARS_PER_TOKEN - len(prefix) - 1
+    if max_chars < MIN_TRUNCATED_CHARS:
+        return prefix
+    cut = sentence[:max_chars].rsplit(" ", 1)[0] if len(sentence) > max_chars else sentence
+    return f"{prefix}{cut}…"
+
+
+def _source_label(doc):
+    label = os.path.basename(doc.metadata.get("source", "desconocido"))
+    page = doc.metadata.get("page")
+    if page is not None:
+        # PyMuPDF numera las páginas desde 0
+        label += f" p.{int(page) + 1}"
+    return label
+
+
+def assemble_context(docs, question, token_budget=None):
+    """
+    Construye el texto del CONTEXTO a partir de los documentos recuperados (en
+    orden de relevancia) sin superar `token_budget`. Devuelve (contexto, estadísticas).
+    """
+    token_budget = token_budget or config.RAG_CONTEXT_TOKEN_BUDGET
+    terms = query_terms(question)
+    seen_sentences = set()
+    lines = []
+    used_tokens = 0
+
+    for position, doc in enumerate(docs):
+        sentences = []
+        for sentence in split_sentences(doc.page_content):
+            key = _normalize(sentence)
+            # El solapamiento entre fragmentos repite frases: solo las usamos una vez
+            if key in seen_sentences:
+                continue
+            seen_sentences.add(key)
+            sentences.append(sentence)
+
+        # Si ninguna frase comparte términos (p.ej. sinónimos), confiamos en el retriever y usamos el inicio
+        relevant = (
+            select_relevant_sentences(sentences, terms, config.RAG_MAX_SENTENCES_PER_CHUNK)
+            or sentences[:config.RAG_MAX_SENTENCES_PER_CHUNK]
+        )
+        if not relevant:
+            continue
+
+        prefix = f"[{len(lines) + 1}] {_source_label(doc)}: "
+        line = prefix
+        for sentence in relevant:
+            candidate = f"{line} {sentence}" if line != prefix else line + sentence
+            if used_tokens + estimate_tokens(candidate) > token_budget:
+                if line == prefix:
+                    # Una frase larga (p.ej. texto sin puntuación) se recorta en lugar de perder la fuente,
+                    # dejando a cada documento restante su parte del presupuesto
+                    share = (token_budget - used_tokens) // (len(docs) - position)
+                    line = truncate_to_tokens(prefix, sentence, share)
+                break
+            line = candidate
+        if line == prefix:
+            # Esta fuente no cabe, pero otra más corta de las siguientes todavía puede caber
+            continue
+        lines.append(line)
+        used_tokens += estimate_tokens(line)
+
+    context = "\n".join(lines)
+    stats = {"documents": len(docs), "sources_used": len(lines), "context_tokens": estimate_tokens(context)}
+    return context, stats
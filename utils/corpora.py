@@ -0,0 +1,27 @@
+# corpora.py
+"""Acceso a la definición de cada corpus de config.CORPORA con sus rutas derivadas."""
+from . import config
+
+
+def list_corpora():
+    return list(config.CORPORA)
+
+
+def get_corpus(name=None):
+    """Devuelve la configuración completa del corpus `name` (o del corpus por defecto)."""
+    name = name or config.DEFAULT_CORPUS
+    if name not in config.CORPORA:
+        raise KeyError(f"Corpus desconocido: '{name}'. Disponibles: {list_corpora()}")
+    corpus = dict(config.CORPORA[name])
+    # Cada sitio organiza sus carpetas a su manera: sin esta lista, la búsqueda de archivos se saltaría sus documentos
+    if not corpus.get("searchable_folders"):
+        raise KeyError(f"El corpus '{name}' debe indicar sus 'searchable_folders'.")
+    root_folder = corpus["root_folder"]
+    corpus.setdefault("index_folder", f"{root_folder}faiss_index_global/")
+    corpus.setdefault("image_folder", f"{root_folder}Fotos/")
+    corpus.setdefault("extraction_folder", f"{root_folder}processed_json_global/")
+    corpus.setdefault("shards_folder", f"{root_folder}faiss_index_shards/")
+    corpus.setdefault("thumbnail_folder", f"{root_folder}thumbnails/")
+    corpus["name"] = name
+    corpus["manifest_path"] = f"{corpus['index_folder']}{config.PROCESSED_FILES_MANIFEST}"
+    return corpus
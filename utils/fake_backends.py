@@ -0,0 +1,274 @@
+# fake_backends.py
+"""
+Servicios externos falsos para probar la carga del pipeline real en local.
+
+Lo que se mide es el código de la app: el enrutado de agent_logic (prompt
+few-shot dinámico y parseo del JSON), las herramientas de tools/gcs_tools
+(paginación, firma de URLs, vistas previas) y la cadena RAG de rag_index
+(QueryBatcher, context_assembly, caché de respuestas). Solo se sustituye lo
+que está al otro lado de la red:
+
+- GCS: un LocalStorageClient sobre un directorio temporal con un corpus
+  sintético (índice FAISS publicado en partes, fotos y PDFs), instalado como
+  `gcs_tools.storage_client`. Cada petición simulada espera la latencia de GCS.
+- Vertex AI: `FakeChatModel` y `FakeEmbeddings`, con latencia por llamada.
+
+Cualquier llamada falsa puede fallar con la probabilidad `error_rate`.
+"""
+import functools
+import hashlib
+import io
+import json
+import os
+import random
+import re
+import shutil
+import tempfile
+import threading
+import time
+from typing import Any, List, Optional
+
+import numpy as np
+from langchain.schema import Document
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from PIL import Image
+
+from . import agent_logic
+from . import config
+from . import gcs_tools
+from . import processing
+from . import rag_index
+from . import routing_prompt
+from . import tools
+from .context_assembly import estimate_tokens
+from .corpora import get_corpus
+from .local_storage import LocalStorageClient
+from .lru_cache import LRUCache
+from .pipeline import ChatPipeline
+from .rag_answers import answer_cache, answer_question
+from .routing_prompt import ROUTING_INSTRUCTIONS
+
+FIND_WORDS = ("foto", "fotografia", "fotografía", "imagen", ".jpg", ".jpeg", ".png", ".pdf", "plano de", "manual de")
+LIST_WORDS = ("lista", "listar", "todos los", "todas las", "qué hay", "que hay", "disponibles")
+EXTENSIONS = ("pdf", "jpg", "jpeg", "png")
+
+# Vocabulario del corpus sintético: las consultas que lo usan recuperan documentos parecidos
+TOPICS = ["bombas", "compresores", "calderas", "ventiladores", "motores", "valvulas"]
+PARTS = ["rodamientos", "juntas", "filtros", "correas", "sensores", "manómetros"]
+FAULTS = ["vibración excesiva", "fuga de aceite", "sobrecalentamiento", "ruido anómalo", "caída de presión"]
+
+FAKE_EMBEDDING_SIZE = 768
+_WORD_RE = re.compile(r"\w+")
+
+
+class FakeBackendError(RuntimeError):
+    """Error inyectado por un backend falso."""
+
+
+class LatencyInjector:
+    """Espera una latencia con variación aleatoria y falla con la probabilidad indicada."""
+
+    def __init__(self, jitter=0.3, error_rate=0.0, seed=None):
+        self.jitter = jitter
+        self.error_rate = error_rate
+        # Desactivado mientras se prepara el corpus: la preparación no forma parte de la medida
+        self.armed = False
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def wait(self, latency_s):
+        if not self.armed:
+            return
+        with self._lock:
+            factor = self._random.uniform(1 - self.jitter, 1 + self.jitter)
+            fail = self._random.random() < self.error_rate
+        time.sleep(max(0.0, latency_s * factor))
+        if fail:
+            raise FakeBackendError("Error inyectado por el backend falso")
+
+
+@functools.lru_cache(maxsize=50000)
+def _word_vector(word):
+    seed = int.from_bytes(hashlib.sha1(word.encode("utf-8")).digest()[:8], "little")
+    return np.random.default_rng(seed).standard_normal(FAKE_EMBEDDING_SIZE).astype(np.float32)
+
+
+class FakeEmbeddings(Embeddings):
+    """
+    Embeddings deterministas de bolsa de palabras: los textos con palabras en
+    común quedan cerca, así que la búsqueda FAISS devuelve documentos con sentido.
+    Cada llamada (un lote completo) cuesta una latencia, como en Vertex AI.
+    """
+
+    def __init__(self, latency_ms=0, injector=None):
+        self.model_name = f"fake-embedding-{FAKE_EMBEDDING_SIZE}"
+        self.latency = latency_ms / 1000
+        self.injector = injector
+
+    def _vector(self, text):
+        vector = np.zeros(FAKE_EMBEDDING_SIZE, dtype=np.float32)
+        for word in _WORD_RE.findall(text.lower()):
+            vector += _word_vector(word)
+        return (vector / max(float(np.linalg.norm(vector)), 1e-12)).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self.injector is not None:
+            self.injector.wait(self.latency)
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+def _routing_reply(prompt):
+    # La consulta es la última línea del prompt de enrutado: Usuario: "<consulta>" ->
+    last_line = prompt.rstrip().rsplit("\n", 1)[-1]
+    query = json.loads(last_line[len("Usuario: "):-len(" ->")])
+    text = query.lower()
+    if any(word in text for word in LIST_WORDS):
+        words = _WORD_RE.findall(text)
+        folder = next((w for w in words if w in EXTENSIONS), words[-1] if words else "")
+        return json.dumps({"intencion": "list_files_in_folder", "detalles": {"folder_name": folder}}, ensure_ascii=False)
+    if any(word in text for word in FIND_WORDS):
+        # Como el modelo real, se queda con el objeto buscado y no con la frase entera
+        words = _WORD_RE.findall(text)
+        keywords = " ".join(w for w in words if w in TOPICS) or (words[-1] if words else query)
+        return json.dumps({"intencion": "find_specific_file", "detalles": {"file_keywords": keywords}}, ensure_ascii=False)
+    return json.dumps({"intencion": "search_knowledge_base", "detalles": {"question": query}}, ensure_ascii=False)
+
+
+def _rag_reply(prompt):
+    question = prompt.split("PREGUNTA: ", 1)[-1].split("\nRESPUESTA:", 1)[0]
+    first_source = re.search(r"^\[1\] ([^:]+):", prompt, re.MULTILINE)
+    if first_source is None:
+        return "No he encontrado información sobre eso en los documentos."
+    return f"Según el documento {first_source.group(1)}, esta es la respuesta simulada a: {question}"
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Modelo de chat falso: responde al prompt de enrutado con el JSON de la
+    intención (por palabras clave) y al prompt RAG citando la primera fuente.
+    """
+
+    latency_ms: float = 500.0
+    injector: Any = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-latency-chat"
+
+    def _generate(self, messages, stop: Optional[List[str]] = None, run_manager=None, **kwargs) -> ChatResult:
+        prompt = messages[-1].content
+        if self.injector is not None:
+            self.injector.wait(self.latency_ms / 1000)
+        content = _routing_reply(prompt) if prompt.startswith(ROUTING_INSTRUCTIONS) else _rag_reply(prompt)
+        input_tokens, output_tokens = estimate_tokens(prompt), estimate_tokens(content)
+        message = AIMessage(
+            content=content,
+            usage_metadata={"input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens},
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+def _tiny_jpeg(seed):
+    color = tuple(random.Random(seed).randrange(256) for _ in range(3))
+    output = io.BytesIO()
+    Image.new("RGB", (64, 48), color).save(output, format="JPEG")
+    return output.getvalue()
+
+
+def build_fake_corpus(root, num_documents=2000, num_files=300, seed=0):
+    """
+    Crea en `root` el bucket del corpus por defecto con un índice publicado de
+    `num_documents` fragmentos sintéticos y `num_files` archivos repartidos en
+    subcarpetas de las carpetas buscables.
+    """
+    corpus = get_corpus()
+    bucket = LocalStorageClient(root).bucket(corpus["bucket"])
+    rng = random.Random(seed)
+
+    docs = []
+    for i in range(num_documents):
+        topic, part, fault = rng.choice(TOPICS), rng.choice(PARTS), rng.choice(FAULTS)
+        text = (
+            f"Mantenimiento de {topic}, procedimiento {i}. Revisar los {part} cada {rng.randrange(50, 2000)} horas de uso. "
+            f"Si aparece {fault} en los {part}, detener el equipo y avisar al supervisor de turno. "
+            f"Registrar la intervención en el parte de {topic} con la fecha y el operario."
+        )
+        source = f"{corpus['root_folder']}Preventivo/manual_{topic}_{i % 40}.pdf"
+        docs.append(Document(page_content=text, metadata={"source": source, "page": i % 25}))
+    vector_store = FAISS.from_documents(docs, FakeEmbeddings())
+    processing.upload_vector_store(bucket, vector_store, gcs_folder=corpus["index_folder"])
+
+    folders = corpus["searchable_folders"]
+    for i in range(num_files):
+        base = folders[i % len(folders)]
+        topic = TOPICS[i % len(TOPICS)]
+        if base == corpus["image_folder"]:
+            bucket.blob(f"{base}{topic}/{topic}_{i:04d}.jpg").upload_from_string(_tiny_jpeg(i), content_type="image/jpeg")
+        else:
+            bucket.blob(f"{base}{topic}/informe_{topic}_{i:04d}.pdf").upload_from_string(b"%PDF-1.4\n", content_type="application/pdf")
+    return corpus
+
+
+class FakeBackends:
+    """
+    Prepara el corpus sintético, instala los servicios falsos y construye la
+    cadena RAG real sobre ellos. `use_cache=False` desactiva la caché de
+    respuestas y la de embeddings de consultas, para que cada repetición
+    mida el trabajo completo.
+    """
+
+    def __init__(self, llm_latency_ms=500, embedding_latency_ms=80, gcs_latency_ms=40, jitter=0.3, error_rate=0.0,
+                 seed=None, num_documents=2000, num_files=300, use_cache=True):
+        self.injector = LatencyInjector(jitter, error_rate, seed)
+        self.use_cache = use_cache
+        self.root = tempfile.mkdtemp(prefix="fake_gcs_")
+
+        # Los artefactos locales de la prueba (miniaturas, índice de ejemplos) no tocan los de la app
+        config.THUMBNAIL_LOCAL_CACHE_DIR = os.path.join(self.root, "_thumbnails")
+        config.ROUTING_EXAMPLE_INDEX_DIR = os.path.join(self.root, "_routing")
+        if not use_cache:
+            config.EMBEDDING_CACHE_SIZE = 0
+            routing_prompt.query_vector_cache = LRUCache(0)
+        answer_cache.clear()
+
+        print(f"[FAKE] Preparando el corpus sintético en {self.root}...")
+        self.corpus = build_fake_corpus(self.root, num_documents, num_files, seed or 0)
+        gcs_latency = gcs_latency_ms / 1000
+        gcs_tools.storage_client = LocalStorageClient(self.root, on_request=lambda operation: self.injector.wait(gcs_latency))
+        self.embeddings = FakeEmbeddings(embedding_latency_ms, self.injector)
+        self.llm = FakeChatModel(latency_ms=llm_latency_ms, injector=self.injector)
+        self._loaded = rag_index.build_loaded_index(
+            self.corpus["name"], warm=False, embeddings=self.embeddings, llm=self.llm
+        )
+        self.injector.armed = True
+
+    # --- Etapas del pipeline ---
+
+    def route(self, query):
+        return agent_logic.get_agent_decision(query, llm=self.llm, embeddings=self.embeddings)
+
+    def answer(self, question):
+        content = answer_question(
+            self._loaded.chain, question, record=False, corpus=self.corpus["name"], use_cache=self.use_cache,
+            version=self._loaded.version,
+        )
+        return {"type": "message", "content": content}
+
+    def pipeline(self):
+        return ChatPipeline(
+            route=self.route,
+            find_file=lambda details: tools.execute_file_search_tool(details, corpus_name=self.corpus["name"]),
+            list_files=lambda details: tools.execute_list_files_in_folder_tool(details, corpus_name=self.corpus["name"]),
+            answer=self.answer,
+        )
+
+    def close(self):
+        self._loaded.close()
+        shutil.rmtree(self.root, ignore_errors=True)
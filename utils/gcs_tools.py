@@ -1,10 +1,13 @@
 # gcs_tools.py
 from google.cloud import storage
 import os
+import json
+import base64
 # [CAMBIO] Importamos datetime y timedelta para manejar la expiración de la URL
 from datetime import datetime, timedelta
 
 from . import config
+from .corpora import get_corpus
 
 from google.auth import compute_engine
 from google.auth.transport import requests as google_requests
@@ -14,7 +17,13 @@ from google.auth.transport import requests as google_requests
 SIGNED_URL_EXPIRATION_SECONDS = 3600
 
 
-storage_client = storage.Client(project=config.PROJECT_ID)
+# Cliente compartido por las herramientas y la carga de índices; el driver de carga lo
+# sustituye por un LocalStorageClient (ver utils/fake_backends.py)
+try:
+    storage_client = storage.Client(project=config.PROJECT_ID)
+except Exception as e:
+    storage_client = None
+    print(f"[GCS_TOOL] ADVERTENCIA: No se pudo crear el cliente de GCS: {e}")
 try:
     # Obtenemos las credenciales del entorno de Compute Engine/Cloud Run
     credentials = compute_engine.Credentials()
@@ -27,22 +36,23 @@ except Exception:
     SERVICE_ACCOUNT_EMAIL = None
     print("[GCS_TOOL] ADVERTENCIA: No se pudo obtener la cuenta de servicio del entorno. La firma de URL fallará si no se configura una clave JSON.")
 
-def find_file_in_gcs(keywords: str):
+def find_file_in_gcs(keywords: str, corpus=None):
     """
-    Busca archivos en GCS y devuelve una URL firmada (temporal y segura) para el acceso.
+    Busca archivos en las carpetas del corpus y devuelve una URL firmada (temporal y segura) para el acceso.
     """
     if not keywords:
         return None 
 
     print(f"[GCS_TOOL] Buscando archivos con palabras clave: '{keywords}'")
     found_files = []
-    bucket = storage_client.bucket(config.BUCKET_NAME)
+    corpus = corpus or get_corpus()
+    bucket = storage_client.bucket(corpus["bucket"])
     
     keyword_parts = keywords.lower().split()
 
     expiration_time = datetime.utcnow() + timedelta(seconds=SIGNED_URL_EXPIRATION_SECONDS)
 
-    for folder_prefix in config.SEARCHABLE_FILE_FOLDERS:
+    for folder_prefix in corpus["searchable_folders"]:
         blobs = bucket.list_blobs(prefix=folder_prefix)
         for blob in blobs:
             if not blob.name.endswith('/') and all(part in blob.name.lower() for part in keyword_parts):
@@ -72,67 +82,105 @@ def find_file_in_gcs(keywords: str):
         return None
 
 
-def list_files_in_specific_folder(folder_name: str):
-    """
-    Lista archivos en GCS y devuelve sus URLs firmadas (temporales y seguras).
-    """
-    if not folder_name:
-        print("[GCS_TOOL] folder_name es obligatorio.")
-        return []
+def _encode_page_token(base_index, last_blob_name):
+    payload = json.dumps({"b": base_index, "o": last_blob_name}).encode("utf-8")
+    return base64.urlsafe_b64encode(payload).decode("ascii")
 
-    folder_name_lower = folder_name.lower().strip()
-    print(f"[GCS_TOOL] Intentando listar archivos para: '{folder_name}'")
-    found_files = []
-    bucket = storage_client.bucket(config.BUCKET_NAME)
+def _decode_page_token(page_token):
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(page_token.encode("ascii")))
+        return int(payload["b"]), payload["o"]
+    except Exception:
+        print(f"[GCS_TOOL] page_token inválido, se empieza desde el principio: '{page_token}'")
+        return 0, None
 
-    # [IMPORTANTE] Reutilizamos la lógica de expiración para las URLs.
-    expiration_time = datetime.utcnow() + timedelta(seconds=SIGNED_URL_EXPIRATION_SECONDS)
+def extension_glob(extension):
+    """Patrón match_glob de GCS para los archivos con esa extensión en cualquier subcarpeta, sin distinguir mayúsculas."""
+    return "**." + "".join(f"[{c.lower()}{c.upper()}]" if c.isalpha() else c for c in extension)
 
+def iter_files_in_specific_folder(folder_name: str, page_token=None, blob_page_size=None, corpus=None):
+    """
+    Generador perezoso de los blobs de una carpeta/categoría, sin firmar URLs.
+    Produce tuplas (blob, page_token) donde page_token permite reanudar el
+    listado justo después de ese blob. GCS solo pide páginas nuevas cuando
+    el consumidor avanza, así que dejar de iterar corta el trabajo en el servidor.
+    """
+    folder_name_lower = folder_name.lower().strip()
     is_extension_like = folder_name_lower in ["pdf", "jpg", "jpeg", "png", "gif", "docx", "xlsx", "pptx", "txt"]
-    search_bases = [p.strip().rstrip('/') + '/' for p in config.SEARCHABLE_FILE_FOLDERS]
+    corpus = corpus or get_corpus()
+    search_bases = [p.strip().rstrip('/') + '/' for p in corpus["searchable_folders"]]
     if not search_bases:
-        print("[GCS_TOOL] config.SEARCHABLE_FILE_FOLDERS no está configurado.")
-        return []
+        print(f"[GCS_TOOL] El corpus '{corpus['name']}' no tiene carpetas buscables configuradas.")
+        return
 
-    print(f"[GCS_TOOL] Bases de búsqueda configuradas: {search_bases}")
+    start_base, start_after = _decode_page_token(page_token) if page_token else (0, None)
+    bucket = storage_client.bucket(corpus["bucket"])
+    seen_paths = set()
 
-    for base_prefix in search_bases:
+    for base_index in range(start_base, len(search_bases)):
+        base_prefix = search_bases[base_index]
         prefix_to_search = base_prefix
         # Si no es una extensión, construimos el prefijo de carpeta completo
         if not is_extension_like:
             prefix_to_search = f"{base_prefix}{folder_name_lower}/"
 
+        list_kwargs = {"prefix": prefix_to_search, "page_size": blob_page_size}
+        # GCS filtra por extensión en el servidor: no recorremos (ni paginamos) el resto de la carpeta
+        if is_extension_like:
+            list_kwargs["match_glob"] = extension_glob(folder_name_lower)
+        # Al reanudar, GCS empieza en start_offset (inclusivo) y saltamos ese blob ya mostrado
+        resume_after = start_after if base_index == start_base else None
+        if resume_after:
+            list_kwargs["start_offset"] = resume_after
+
         print(f"[GCS_TOOL] Buscando blobs con prefijo: '{prefix_to_search}'")
-        blobs_iterator = bucket.list_blobs(prefix=prefix_to_search)
-
-        for blob in blobs_iterator:
-            # Condición para agregar el archivo
-            should_add = False
-            # Si buscamos por extensión, comprobamos que el nombre termine con ella
-            if is_extension_like:
-                if blob.name.lower().endswith(f".{folder_name_lower}") and not blob.name.endswith('/'):
-                    should_add = True
-            # Si buscamos por carpeta, simplemente añadimos todo lo que no sea una carpeta
-            else:
-                if not blob.name.endswith('/'):
-                    should_add = True
-            
-            if should_add:
-                # [CAMBIO] Generamos la URL firmada para cada archivo encontrado.
-                signed_url = blob.generate_signed_url(
-                    version="v4",
-                    expiration=expiration_time,
-                    method="GET",
-                    credentials=credentials
-                )
-                found_files.append({
-                    "name": os.path.basename(blob.name),
-                    "path": blob.name,
-                    # [CAMBIO] Usamos la nueva URL firmada.
-                    "url": signed_url
-                })
-    
-    unique_files = {f["path"]: f for f in found_files}.values()
+        for blob in bucket.list_blobs(**list_kwargs):
+            if blob.name == resume_after or blob.name.endswith('/') or blob.name in seen_paths:
+                continue
+            # match_glob ya filtra por extensión; lo comprobamos también por si el backend lo ignora
+            if is_extension_like and not blob.name.lower().endswith(f".{folder_name_lower}"):
+                continue
+            seen_paths.add(blob.name)
+            yield blob, _encode_page_token(base_index, blob.name)
+
+def list_files_in_specific_folder(folder_name: str, page_size=None, page_token=None, corpus=None):
+    """
+    Lista una página de archivos de una carpeta en GCS con sus URLs firmadas.
+    Devuelve (archivos, next_page_token); next_page_token es None en la última página.
+    Solo se firman las URLs de la página devuelta.
+    """
+    if not folder_name:
+        print("[GCS_TOOL] folder_name es obligatorio.")
+        return [], None
+
+    page_size = min(page_size or config.FOLDER_LISTING_PAGE_SIZE, config.FOLDER_LISTING_MAX_PAGE_SIZE)
+    print(f"[GCS_TOOL] Intentando listar archivos para: '{folder_name}' (página de {page_size})")
+
+    # [IMPORTANTE] Reutilizamos la lógica de expiración para las URLs.
+    expiration_time = datetime.utcnow() + timedelta(seconds=SIGNED_URL_EXPIRATION_SECONDS)
 
-    print(f"[GCS_TOOL] Encontrados {len(unique_files)} archivos para la solicitud '{folder_name}'.")
-    return list(unique_files)
\ No newline at end of file
+    page = []
+    next_page_token = None
+    # Pedimos a GCS páginas del tamaño justo (+1 para saber si hay más resultados)
+    files_iterator = iter_files_in_specific_folder(folder_name, page_token, blob_page_size=page_size + 1, corpus=corpus)
+    for blob, token in files_iterator:
+        if len(page) == page_size:
+            # Hay al menos un archivo más: el token apunta al último archivo de esta página
+            next_page_token = last_token
+            break
+        signed_url = blob.generate_signed_url(
+            version="v4",
+            expiration=expiration_time,
+            method="GET",
+            credentials=credentials
+        )
+        page.append({
+            "name": os.path.basename(blob.name),
+            "path": blob.name,
+            "url": signed_url
+        })
+        last_token = token
+    files_iterator.close()
+
+    print(f"[GCS_TOOL] Página con {len(page)} archivos para la solicitud '{folder_name}' (hay más: {next_page_token is not None}).")
+    return page, next_page_token
@@ -0,0 +1,153 @@
+# index_artifacts.py
+"""
+Publicación del índice FAISS en partes comprimidas con transferencia en paralelo.
+
+Cada archivo del índice (index.faiss, index.pkl) se divide en partes de
+`config.INDEX_PART_SIZE_BYTES`, que se comprimen con zstd y se suben/descargan
+en paralelo. La estructura en GCS es:
+
+    <carpeta>/parts/<versión>/index.faiss.00000.zst
+    <carpeta>/parts/<versión>/index.faiss.00001.zst
+    ...
+    <carpeta>/index_artifacts.json   <- manifiesto con las partes y sus sha256
+
+El manifiesto se sube el último, así que un lector nunca ve una versión a
+medias. Al descargar se comprueba el sha256 de cada parte y del archivo
+reensamblado completo.
+"""
+import hashlib
+import json
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import zstandard
+
+from . import config
+
+
+class IndexIntegrityError(ValueError):
+    """Una parte o un archivo reensamblado no coincide con el checksum del manifiesto."""
+
+
+def _sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def manifest_blob_name(gcs_folder):
+    return f"{gcs_folder}{config.INDEX_ARTIFACTS_MANIFEST}"
+
+
+def artifacts_exist(bucket, gcs_folder):
+    return bucket.blob(manifest_blob_name(gcs_folder)).exists()
+
+
+def published_version(bucket, gcs_folder):
+    """Versión publicada en el manifiesto, o None si no hay manifiesto (formato antiguo)."""
+    blob = bucket.blob(manifest_blob_name(gcs_folder))
+    if not blob.exists():
+        return None
+    return json.loads(blob.download_as_bytes())["version"]
+
+
+def _upload_part(bucket, path, offset, size, part_name):
+    with open(path, "rb") as f:
+        f.seek(offset)
+        raw = f.read(size)
+    compressed = zstandard.ZstdCompressor(level=config.INDEX_ZSTD_LEVEL).compress(raw)
+    bucket.blob(part_name).upload_from_string(compressed, content_type="application/zstd")
+    return {"name": part_name, "offset": offset, "raw_size": len(raw), "sha256": _sha256(compressed)}
+
+
+def new_version():
+    """Identificador de versión que se ordena como texto en orden de publicación, incluso dentro del mismo segundo."""
+    now_ns = time.time_ns()
+    timestamp = time.strftime("%Y%m%dT%H%M%S", time.localtime(now_ns // 10**9))
+    return f"{timestamp}.{now_ns % 10**9:09d}-{uuid.uuid4().hex[:6]}"
+
+
+def publish_artifacts(bucket, local_dir, filenames, gcs_folder):
+    """Sube los archivos de `local_dir` como partes comprimidas y publica su manifiesto."""
+    version = new_version()
+    manifest = {"version": version, "files": {}}
+
+    with ThreadPoolExecutor(max_workers=config.INDEX_TRANSFER_WORKERS) as executor:
+        for filename in filenames:
+            path = os.path.join(local_dir, filename)
+            size = os.path.getsize(path)
+            futures = []
+            # Incluso un archivo vacío tiene una parte, para que el manifiesto sea uniforme
+            for part_index, offset in enumerate(range(0, max(size, 1), config.INDEX_PART_SIZE_BYTES)):
+                part_name = f"{gcs_folder}parts/{version}/{filename}.{part_index:05d}.zst"
+                futures.append(executor.submit(
+                    _upload_part, bucket, path, offset, config.INDEX_PART_SIZE_BYTES, part_name
+                ))
+            manifest["files"][filename] = {
+                "size": size,
+                "sha256": _file_sha256(path),
+                "parts": [future.result() for future in futures],
+            }
+
+    bucket.blob(manifest_blob_name(gcs_folder)).upload_from_string(
+        json.dumps(manifest, indent=2), content_type="application/json"
+    )
+    print(f"[INDEX] Publicada la versión {version} en {gcs_folder}")
+    _delete_old_versions(bucket, gcs_folder, keep=version)
+    return version
+
+
+def _delete_old_versions(bucket, gcs_folder, keep):
+    # Conservamos también las versiones anteriores más recientes por si hay lectores descargándolas
+    parts_prefix = f"{gcs_folder}parts/"
+    blobs_by_version = {}
+    for blob in bucket.list_blobs(prefix=parts_prefix):
+        version = blob.name[len(parts_prefix):].split("/", 1)[0]
+        blobs_by_version.setdefault(version, []).append(blob)
+    old_versions = sorted(v for v in blobs_by_version if v != keep)
+    to_delete = old_versions[:max(0, len(old_versions) - (config.INDEX_KEEP_VERSIONS - 1))]
+    for version in to_delete:
+        for blob in blobs_by_version[version]:
+            blob.delete()
+
+
+def _download_part(bucket, part, path):
+    compressed = bucket.blob(part["name"]).download_as_bytes()
+    if _sha256(compressed) != part["sha256"]:
+        raise IndexIntegrityError(f"Checksum incorrecto en la parte {part['name']}")
+    raw = zstandard.ZstdDecompressor().decompress(compressed, max_output_size=part["raw_size"])
+    if len(raw) != part["raw_size"]:
+        raise IndexIntegrityError(f"Tamaño incorrecto al descomprimir {part['name']}")
+    with open(path, "r+b") as f:
+        f.seek(part["offset"])
+        f.write(raw)
+
+
+def fetch_artifacts(bucket, local_dir, gcs_folder):
+    """Descarga en paralelo las partes del manifiesto y reensambla y verifica cada archivo."""
+    manifest = json.loads(bucket.blob(manifest_blob_name(gcs_folder)).download_as_bytes())
+
+    with ThreadPoolExecutor(max_workers=config.INDEX_TRANSFER_WORKERS) as executor:
+        futures = []
+        for filename, file_info in manifest["files"].items():
+            path = os.path.join(local_dir, filename)
+            # Reservamos el tamaño final para que cada parte escriba en su offset
+            with open(path, "wb") as f:
+                f.truncate(file_info["size"])
+            futures.extend(executor.submit(_download_part, bucket, part, path) for part in file_info["parts"])
+        for future in futures:
+            future.result()
+
+    for filename, file_info in manifest["files"].items():
+        if _file_sha256(os.path.join(local_dir, filename)) != file_info["sha256"]:
+            raise IndexIntegrityError(f"El archivo reensamblado {filename} no coincide con el manifiesto")
+    print(f"[INDEX] Descargada y verificada la versión {manifest['version']} de {gcs_folder}")
+    return manifest["version"]
@@ -0,0 +1,187 @@
+# index_registry.py
+"""
+Índices cargados en memoria, uno por corpus, con residencia LRU.
+
+Cada corpus cargado ocupa su índice FAISS, su docstore y su `QueryBatcher`.
+El registro mantiene como mucho `config.INDEX_MEMORY_BUDGET_BYTES` (estimados)
+en memoria: al cargar uno nuevo descarga los menos usados recientemente, que
+se volverán a cargar desde GCS cuando alguien los pida. El índice recién
+cargado nunca se descarga, aunque por sí solo supere el presupuesto.
+
+Descargar un corpus no interrumpe a las sesiones que ya tienen su cadena: sus
+búsquedas siguen funcionando (sin agrupar) y la memoria se libera cuando la
+última deja de usarla.
+
+Las versiones nuevas de un índice las recoge un hilo de fondo (`start_refresher`):
+carga y calienta la nueva mientras la residente sigue atendiendo, y solo entonces
+la sustituye, así que ninguna sesión espera a una recarga.
+"""
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from . import config
+
+
+def estimate_vector_store_bytes(vector_store):
+    """Estimación de la memoria de un FAISS de LangChain: vectores float32 más el texto del docstore."""
+    index = vector_store.index
+    vector_bytes = index.ntotal * index.d * 4
+    docs = getattr(vector_store.docstore, "_dict", {})
+    text_bytes = sum(sys.getsizeof(doc.page_content) for doc in docs.values())
+    return vector_bytes + text_bytes
+
+
+class LoadedIndex:
+    """Un corpus residente: su cadena RAG, la versión publicada que contiene y lo necesario para liberarla."""
+
+    def __init__(self, name, chain, size_bytes, on_close=None, version=None):
+        self.name = name
+        self.chain = chain
+        self.size_bytes = size_bytes
+        self.version = version
+        self._on_close = on_close
+
+    def close(self):
+        if self._on_close is not None:
+            self._on_close()
+
+
+class IndexRegistry:
+    def __init__(self, memory_budget=None):
+        self.memory_budget = memory_budget or config.INDEX_MEMORY_BUDGET_BYTES
+        self._resident = OrderedDict()
+        self._lock = threading.Lock()
+        # Un candado por corpus: dos sesiones que piden el mismo índice lo cargan una sola vez
+        self._load_locks = {}
+        self._refresher = None
+
+    def _load_lock(self, name):
+        with self._lock:
+            return self._load_locks.setdefault(name, threading.Lock())
+
+    def _lookup(self, name):
+        with self._lock:
+            entry = self._resident.get(name)
+            if entry is not None:
+                self._resident.move_to_end(name)
+            return entry
+
+    def _peek(self, name):
+        # Como _lookup, pero sin contar como uso (para las comprobaciones de fondo)
+        with self._lock:
+            return self._resident.get(name)
+
+    def get(self, name, loader):
+        """
+        Devuelve el índice residente de `name` o lo carga con `loader(name)`, que
+        debe devolver un `LoadedIndex` (o None si el corpus no se puede cargar).
+        """
+        entry = self._lookup(name)
+        if entry is not None:
+            return entry
+        with self._load_lock(name):
+            entry = self._lookup(name)
+            if entry is not None:
+                # Otro hilo lo ha cargado mientras esperábamos
+                return entry
+            entry = loader(name)
+            if entry is None:
+                return None
+            self._install(name, entry)
+        return entry
+
+    def reload(self, name, loader, expected=None):
+        """
+        Carga otra vez `name` (p.ej. la versión recién publicada) mientras la residente
+        sigue atendiendo, y la sustituye al terminar. Si la recarga falla se sigue
+        sirviendo la anterior. Con `expected`, solo recarga si la residente sigue
+        siendo esa (no recarga un corpus que ya se ha descargado o recargado).
+        """
+        with self._load_lock(name):
+            current = self._peek(name)
+            if expected is not None and current is not expected:
+                return current
+            try:
+                entry = loader(name)
+            except Exception as e:
+                if current is None:
+                    raise
+                print(f"[REGISTRY] Falló la recarga del corpus '{name}': {e}")
+                entry = None
+            if entry is None:
+                return current
+            self._install(name, entry)
+        return entry
+
+    def _install(self, name, entry):
+        with self._lock:
+            replaced = self._resident.pop(name, None)
+            self._resident[name] = entry
+            evicted = self._evict_over_budget(keep=name)
+        if replaced is not None:
+            replaced.close()
+        for old in evicted:
+            print(f"[REGISTRY] Descargado el corpus '{old.name}' (~{old.size_bytes / 2**20:.0f} MiB) por presupuesto de memoria.")
+            old.close()
+        print(f"[REGISTRY] Corpus '{name}' cargado (~{entry.size_bytes / 2**20:.0f} MiB). Residentes: {list(self._resident)}")
+
+    def refresh_stale(self, loader, is_current):
+        """Recarga los corpus residentes para los que `is_current(entry)` indica que hay otra versión publicada."""
+        with self._lock:
+            entries = list(self._resident.values())
+        for entry in entries:
+            if not is_current(entry):
+                print(f"[REGISTRY] Hay una versión nueva del corpus '{entry.name}' publicada; recargando en segundo plano...")
+                self.reload(entry.name, loader, expected=entry)
+
+    def start_refresher(self, loader, is_current, interval_s=None):
+        """Lanza (una sola vez por proceso) el hilo que comprueba cada `interval_s` si hay versiones nuevas."""
+        interval_s = interval_s or config.INDEX_VERSION_CHECK_INTERVAL_S
+        with self._lock:
+            if self._refresher is not None:
+                return
+            self._refresher = threading.Thread(
+                target=self._refresh_loop, args=(loader, is_current, interval_s), name="index-refresher", daemon=True
+            )
+        self._refresher.start()
+
+    def _refresh_loop(self, loader, is_current, interval_s):
+        while True:
+            time.sleep(interval_s)
+            try:
+                self.refresh_stale(loader, is_current)
+            except Exception as e:
+                print(f"[REGISTRY] Error comprobando versiones nuevas de los índices: {e}")
+
+    def _evict_over_budget(self, keep):
+        evicted = []
+        total = sum(entry.size_bytes for entry in self._resident.values())
+        for name in list(self._resident):
+            if total <= self.memory_budget:
+                break
+            if name == keep:
+                continue
+            entry = self._resident.pop(name)
+            total -= entry.size_bytes
+            evicted.append(entry)
+        return evicted
+
+    def evict(self, name):
+        """Descarga un corpus (p.ej. tras reindexarlo); la próxima petición lo recarga."""
+        with self._load_lock(name):
+            with self._lock:
+                entry = self._resident.pop(name, None)
+            if entry is not None:
+                entry.close()
+        return entry is not None
+
+    def resident(self):
+        """Corpus cargados, del menos al más usado recientemente, con su tamaño estimado."""
+        with self._lock:
+            return [(name, entry.size_bytes) for name, entry in self._resident.items()]
+
+
+# Registro compartido por todas las sesiones del proceso
+registry = IndexRegistry()
@@ -0,0 +1,260 @@
+# indexing_job.py
+"""
+Job de indexación distribuida (map-reduce) sin interfaz.
+
+Los PDFs del corpus se reparten entre N workers según un hash estable de su
+ruta. Cada worker (fase map) procesa solo su parte y deja un shard parcial
+(índice FAISS + docstore) en la carpeta `shards_folder/<run_id>/` del corpus. La
+fase reduce combina todos los shards y publica el índice y el manifiesto en las
+mismas rutas que usan los indexadores de siempre, así que la app no nota la
+diferencia. El corpus se elige con --corpus (por defecto, INDEX_CORPUS o el
+corpus por defecto).
+
+Uso en Cloud Run Jobs (las variables CLOUD_RUN_TASK_INDEX/COUNT las pone Cloud Run):
+    python -m utils.indexing_job map --run-id 2024-06-01 --corpus infinitydelta
+    python -m utils.indexing_job reduce --run-id 2024-06-01
+
+El reduce toma el número de shards de sus manifiestos, así que puede ejecutarse
+como un job de una sola tarea.
+
+Prueba en local con varios procesos y un directorio en lugar del bucket:
+    python -m utils.indexing_job local --workers 4 --local-bucket /tmp/bucket --fake-embeddings
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from langchain_community.vectorstores import FAISS
+
+from . import config
+from . import query_log
+from .corpora import get_corpus
+from .local_storage import LocalStorageClient
+from .processing import (
+    is_indexable_pdf,
+    load_pdf_blob,
+    split_documents,
+    upload_vector_store,
+    download_vector_store,
+)
+
+SHARD_MANIFEST_FILENAME = "shard_manifest.json"
+# Dimensión de los embeddings falsos (la misma que text-embedding-004)
+FAKE_EMBEDDING_SIZE = 768
+
+
+def get_bucket(local_root=None, corpus=None):
+    """Devuelve el bucket de GCS del corpus o, si se indica `local_root`, su sustituto en disco."""
+    bucket_name = (corpus or get_corpus())["bucket"]
+    if local_root:
+        return LocalStorageClient(local_root).bucket(bucket_name)
+    from google.cloud import storage
+    return storage.Client(project=config.PROJECT_ID).bucket(bucket_name)
+
+
+def get_embeddings(fake=False):
+    """Modelo de embeddings de Vertex AI, o uno determinista y sin red para pruebas locales."""
+    if fake:
+        from langchain_community.embeddings import DeterministicFakeEmbedding
+        return DeterministicFakeEmbedding(size=FAKE_EMBEDDING_SIZE)
+    from langchain_google_vertexai import VertexAIEmbeddings
+    return VertexAIEmbeddings(**config.EMBEDDING_MODEL_CONFIG)
+
+
+def shard_for_blob(blob_name, task_count):
+    """Asigna un PDF a un shard. Usa sha1 porque hash() cambia entre procesos."""
+    digest = hashlib.sha1(blob_name.encode("utf-8")).hexdigest()
+    return int(digest, 16) % task_count
+
+
+def run_folder(run_id, corpus=None):
+    return f"{(corpus or get_corpus())['shards_folder']}{run_id}/"
+
+
+def shard_folder(run_id, task_index, corpus=None):
+    return f"{run_folder(run_id, corpus)}shard-{task_index:05d}/"
+
+
+def run_map_task(bucket, embeddings, run_id, task_index, task_count, corpus=None):
+    """
+    Fase map: procesa los PDFs del corpus que caen en `task_index` y sube su
+    shard parcial. Devuelve el número de fragmentos indexados.
+    """
+    corpus = corpus or get_corpus()
+    print(f"[MAP {task_index}/{task_count}] Listando PDFs del corpus '{corpus['name']}'...")
+    pdf_blobs = [
+        blob for blob in bucket.list_blobs(prefix=corpus["root_folder"])
+        if is_indexable_pdf(blob.name, corpus["image_folder"]) and shard_for_blob(blob.name, task_count) == task_index
+    ]
+    print(f"[MAP {task_index}/{task_count}] {len(pdf_blobs)} PDFs asignados a este shard.")
+
+    all_docs = []
+    pdf_state = {}
+    for blob in pdf_blobs:
+        try:
+            all_docs.extend(load_pdf_blob(blob, bucket, corpus["extraction_folder"]))
+            pdf_state[blob.name] = blob.updated.isoformat()
+        except Exception as e:
+            print(f"[MAP {task_index}/{task_count}] Error procesando {blob.name}: {e}")
+
+    chunks = split_documents(all_docs)
+    folder = shard_folder(run_id, task_index, corpus)
+
+    # Un shard sin fragmentos solo publica su manifiesto, para que el reduce sepa que terminó
+    if chunks:
+        start_time = time.time()
+        vector_store = FAISS.from_documents(chunks, embeddings)
+        print(f"[MAP {task_index}/{task_count}] {len(chunks)} fragmentos indexados en {time.time() - start_time:.2f} segundos.")
+        upload_vector_store(bucket, vector_store, gcs_folder=folder)
+
+    # El manifiesto se sube al final: su presencia marca el shard como completo
+    shard_manifest = {
+        "corpus": corpus["name"],
+        "task_index": task_index,
+        "task_count": task_count,
+        "num_chunks": len(chunks),
+        "pdf_state": pdf_state,
+    }
+    bucket.blob(f"{folder}{SHARD_MANIFEST_FILENAME}").upload_from_string(
+        json.dumps(shard_manifest, indent=2), content_type="application/json"
+    )
+    return len(chunks)
+
+
+def read_shard_manifests(bucket, run_id, task_count=None, corpus=None):
+    """
+    Lee los manifiestos de los shards de la ejecución y comprueba que están todos.
+    El número de shards se toma de los propios manifiestos (lo fijó el map); si se
+    indica `task_count` y no coincide, se rechaza la ejecución en lugar de publicar
+    un índice parcial.
+    """
+    shard_manifests = {}
+    for blob in bucket.list_blobs(prefix=run_folder(run_id, corpus)):
+        if blob.name.endswith(f"/{SHARD_MANIFEST_FILENAME}"):
+            shard_manifest = json.loads(blob.download_as_bytes())
+            shard_manifests[shard_manifest["task_index"]] = shard_manifest
+    if not shard_manifests:
+        raise RuntimeError(f"La ejecución '{run_id}' no tiene ningún shard terminado.")
+
+    map_task_counts = {shard_manifest["task_count"] for shard_manifest in shard_manifests.values()}
+    if len(map_task_counts) > 1:
+        raise RuntimeError(f"Los shards de la ejecución '{run_id}' no coinciden en el número de tareas: {sorted(map_task_counts)}")
+    map_task_count = map_task_counts.pop()
+    if task_count is not None and task_count != map_task_count:
+        raise RuntimeError(
+            f"La ejecución '{run_id}' se mapeó con {map_task_count} tareas y el reduce espera {task_count}."
+        )
+
+    missing = [task_index for task_index in range(map_task_count) if task_index not in shard_manifests]
+    if missing:
+        raise RuntimeError(f"Faltan shards por terminar en la ejecución '{run_id}': {missing}")
+    return [shard_manifests[task_index] for task_index in range(map_task_count)]
+
+
+def run_reduce(bucket, embeddings, run_id, task_count=None, cleanup=True, corpus=None):
+    """
+    Fase reduce: comprueba que todos los shards terminaron, los combina y publica
+    el índice global del corpus junto con el manifiesto de PDFs procesados.
+    `task_count` es opcional: si se indica, debe coincidir con el del map.
+    """
+    corpus = corpus or get_corpus()
+    shard_manifests = read_shard_manifests(bucket, run_id, task_count, corpus)
+
+    merged_store = None
+    merged_state = {}
+    merged_shards = 0
+    for shard_manifest in shard_manifests:
+        merged_state.update(shard_manifest["pdf_state"])
+        merged_shards += 1
+        if not shard_manifest["num_chunks"]:
+            continue
+        shard_store = download_vector_store(
+            bucket, embeddings, gcs_folder=shard_folder(run_id, shard_manifest["task_index"], corpus)
+        )
+        if merged_store is None:
+            merged_store = shard_store
+        else:
+            merged_store.merge_from(shard_store)
+        print(f"[REDUCE] Shard {shard_manifest['task_index']} combinado ({shard_manifest['num_chunks']} fragmentos).")
+
+    if merged_store is None:
+        raise RuntimeError(f"Ningún shard de la ejecución '{run_id}' produjo fragmentos.")
+
+    print("[REDUCE] Publicando el índice combinado...")
+    upload_vector_store(bucket, merged_store, gcs_folder=corpus["index_folder"])
+    manifest_blob = bucket.blob(corpus["manifest_path"])
+    manifest_blob.upload_from_string(json.dumps(merged_state, indent=2), content_type="application/json")
+
+    # Los shards solo se borran si el índice publicado los incluye todos
+    if cleanup and merged_shards == shard_manifests[0]["task_count"]:
+        for blob in list(bucket.list_blobs(prefix=run_folder(run_id, corpus))):
+            blob.delete()
+
+    # Las instancias detectan la nueva versión y calientan sus cachés leyendo el registro
+    # sin compactarlo; la compactación la hace solo quien publica (el registro es del corpus por defecto)
+    if corpus["name"] == config.DEFAULT_CORPUS:
+        try:
+            print(f"[REDUCE] Registro de preguntas compactado ({query_log.compact_deltas(bucket)} deltas).")
+        except Exception as e:
+            print(f"[REDUCE] No se pudo compactar el registro de preguntas: {e}")
+
+    print(f"[REDUCE] Índice publicado con {len(merged_state)} PDFs y {merged_store.index.ntotal} vectores.")
+    return merged_store.index.ntotal
+
+
+def _local_map_worker(local_root, fake_embeddings, run_id, task_index, task_count, corpus_name):
+    # Cada proceso crea su propio bucket y modelo: no se pueden compartir entre procesos
+    corpus = get_corpus(corpus_name)
+    bucket = get_bucket(local_root, corpus)
+    return run_map_task(bucket, get_embeddings(fake_embeddings), run_id, task_index, task_count, corpus)
+
+
+def run_local(workers, local_root=None, fake_embeddings=False, run_id=None, corpus_name=None):
+    """Ejecuta el map en `workers` procesos de esta máquina y después el reduce."""
+    corpus = get_corpus(corpus_name)
+    run_id = run_id or time.strftime("local-%Y%m%d-%H%M%S")
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(_local_map_worker, local_root, fake_embeddings, run_id, task_index, workers, corpus["name"])
+            for task_index in range(workers)
+        ]
+        for future in futures:
+            future.result()
+    return run_reduce(get_bucket(local_root, corpus), get_embeddings(fake_embeddings), run_id, workers, corpus=corpus)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Indexación distribuida de los PDFs de GCS.")
+    parser.add_argument("command", choices=["map", "reduce", "local"])
+    parser.add_argument("--corpus", default=os.environ.get("INDEX_CORPUS") or config.DEFAULT_CORPUS)
+    parser.add_argument("--run-id", default=os.environ.get("INDEX_RUN_ID") or os.environ.get("CLOUD_RUN_EXECUTION"))
+    parser.add_argument("--task-index", type=int, default=int(os.environ.get("CLOUD_RUN_TASK_INDEX", 0)))
+    parser.add_argument("--task-count", type=int, help="Tareas del map (por defecto CLOUD_RUN_TASK_COUNT). En el reduce solo se comprueba contra los shards.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Procesos para el modo 'local'.")
+    parser.add_argument("--local-bucket", help="Directorio que sustituye al bucket de GCS.")
+    parser.add_argument("--fake-embeddings", action="store_true", help="Embeddings deterministas sin llamar a Vertex AI.")
+    parser.add_argument("--keep-shards", action="store_true", help="No borrar los shards parciales tras el reduce.")
+    args = parser.parse_args(argv)
+
+    if args.command == "local":
+        run_local(args.workers, args.local_bucket, args.fake_embeddings, args.run_id, args.corpus)
+        return
+
+    if not args.run_id:
+        parser.error("--run-id (o INDEX_RUN_ID) es obligatorio para 'map' y 'reduce'.")
+
+    corpus = get_corpus(args.corpus)
+    bucket = get_bucket(args.local_bucket, corpus)
+    embeddings = get_embeddings(args.fake_embeddings)
+    if args.command == "map":
+        task_count = args.task_count or int(os.environ.get("CLOUD_RUN_TASK_COUNT", 1))
+        run_map_task(bucket, embeddings, args.run_id, args.task_index, task_count, corpus)
+    else:
+        run_reduce(bucket, embeddings, args.run_id, args.task_count, cleanup=not args.keep_shards, corpus=corpus)
+
+
+if __name__ == "__main__":
+    main()
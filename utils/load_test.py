@@ -0,0 +1,145 @@
+# load_test.py
+"""
+Driver de carga concurrente para el pipeline completo, sin Streamlit.
+
+Reproduce un archivo JSONL de consultas ({"query": "..."} por línea) con una
+concurrencia y una tasa de llegada configurables contra el pipeline real
+(enrutado, herramientas y cadena RAG) sobre los backends falsos de
+utils/fake_backends.py, e informa del throughput, los percentiles p50/p95/p99
+por etapa y la tasa de errores.
+
+    python -m utils.load_test consultas.jsonl --concurrency 32 --rate 20 --llm-latency-ms 600
+
+Sin --rate, las consultas se envían tan rápido como lo permite la concurrencia
+(bucle cerrado). Con --rate, llegan según un proceso de Poisson (bucle abierto) y
+el tiempo total incluye la espera en cola. Con --repeat, usa --no-cache para que
+las repeticiones no se sirvan desde la caché de respuestas.
+"""
+import argparse
+import json
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .fake_backends import FakeBackends
+
+
+def load_queries(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line)["query"] for line in f if line.strip()]
+
+
+def percentile(sorted_values, pct):
+    """Percentil por rango más cercano sobre una lista ya ordenada."""
+    if not sorted_values:
+        return None
+    rank = max(1, int(round(pct / 100 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def _timed_run(pipeline, query, arrival):
+    try:
+        outcome = pipeline.run(query)
+        return {"timings": outcome["timings"], "total": time.perf_counter() - arrival, "error": None}
+    except Exception as e:
+        return {"timings": {}, "total": time.perf_counter() - arrival, "error": repr(e)}
+
+
+def run_load_test(pipeline, queries, concurrency, rate=None, repeat=1, seed=None):
+    """Ejecuta todas las consultas y devuelve el informe agregado."""
+    arrivals = random.Random(seed)
+    workload = queries * repeat
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        start = time.perf_counter()
+        next_arrival = start
+        futures = []
+        for query in workload:
+            if rate:
+                next_arrival += arrivals.expovariate(rate)
+                time.sleep(max(0.0, next_arrival - time.perf_counter()))
+            futures.append(executor.submit(_timed_run, pipeline, query, time.perf_counter()))
+        results = [future.result() for future in futures]
+        wall_time = time.perf_counter() - start
+    return summarize(results, wall_time)
+
+
+def summarize(results, wall_time):
+    stage_samples = {}
+    for result in results:
+        for stage, seconds in result["timings"].items():
+            stage_samples.setdefault(stage, []).append(seconds)
+        if result["error"] is None:
+            stage_samples.setdefault("total", []).append(result["total"])
+
+    errors = [result["error"] for result in results if result["error"] is not None]
+    ok = len(results) - len(errors)
+    stages = {}
+    for stage, samples in stage_samples.items():
+        samples.sort()
+        stages[stage] = {
+            "count": len(samples),
+            "p50_ms": round(percentile(samples, 50) * 1000, 1),
+            "p95_ms": round(percentile(samples, 95) * 1000, 1),
+            "p99_ms": round(percentile(samples, 99) * 1000, 1),
+        }
+    return {
+        "requests": len(results),
+        "wall_time_s": round(wall_time, 2),
+        "throughput_rps": round(ok / wall_time, 2) if wall_time else None,
+        "error_rate": round(len(errors) / len(results), 4) if results else 0.0,
+        "sample_errors": errors[:5],
+        "stages": stages,
+    }
+
+
+def print_report(report):
+    print(f"Peticiones: {report['requests']}  Tiempo: {report['wall_time_s']}s  "
+          f"Throughput: {report['throughput_rps']} req/s  Errores: {report['error_rate']:.2%}")
+    print(f"{'etapa':<24}{'n':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for stage, stats in sorted(report["stages"].items()):
+        print(f"{stage:<24}{stats['count']:>7}{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['p99_ms']:>10}")
+    for error in report["sample_errors"]:
+        print(f"  error: {error}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Prueba de carga del pipeline de chat con backends falsos.")
+    parser.add_argument("queries", help="Archivo JSONL con un objeto {\"query\": ...} por línea.")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--rate", type=float, help="Llegadas por segundo (Poisson). Sin valor: bucle cerrado.")
+    parser.add_argument("--repeat", type=int, default=1, help="Veces que se reproduce el archivo completo.")
+    parser.add_argument("--llm-latency-ms", type=float, default=500)
+    parser.add_argument("--embedding-latency-ms", type=float, default=80)
+    parser.add_argument("--gcs-latency-ms", type=float, default=40)
+    parser.add_argument("--jitter", type=float, default=0.3, help="Variación relativa de las latencias (0.3 = ±30%%).")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Probabilidad de fallo de cada llamada falsa.")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--no-cache", action="store_true", help="Desactiva las cachés de respuestas y de embeddings.")
+    parser.add_argument("--documents", type=int, default=2000, help="Fragmentos del índice sintético.")
+    parser.add_argument("--files", type=int, default=300, help="Archivos sintéticos en las carpetas buscables.")
+    parser.add_argument("--output", help="Guarda también el informe en JSON.")
+    args = parser.parse_args(argv)
+
+    backends = FakeBackends(
+        llm_latency_ms=args.llm_latency_ms,
+        embedding_latency_ms=args.embedding_latency_ms,
+        gcs_latency_ms=args.gcs_latency_ms,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        seed=args.seed,
+        num_documents=args.documents,
+        num_files=args.files,
+        use_cache=not args.no_cache,
+    )
+    try:
+        report = run_load_test(backends.pipeline(), load_queries(args.queries), args.concurrency, args.rate, args.repeat, args.seed)
+    finally:
+        backends.close()
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+# local_storage.py
+"""
+Sustituto en sistema de archivos de un bucket de GCS.
+
+Implementa el subconjunto de la API de google-cloud-storage que usan los
+indexadores y las herramientas (bucket.blob, bucket.list_blobs, blob.upload_*,
+blob.download_*...), de modo que el mismo código pueda ejecutarse en local
+contra un directorio, por ejemplo con varios procesos compartiendo la carpeta.
+
+`on_request`, si se indica, se llama con el nombre de la operación antes de
+cada una que en GCS sería una petición de red (listar una página, leer,
+escribir, borrar, firmar una URL); el driver de carga lo usa para simular la
+latencia y los errores de GCS.
+"""
+import os
+import re
+import base64
+import hashlib
+import shutil
+import tempfile
+from datetime import datetime, timezone
+
+# Tamaño de página que usa GCS al listar si no se indica otro
+DEFAULT_LIST_PAGE_SIZE = 1000
+
+
+class LocalBlob:
+    """Objeto equivalente a `storage.Blob` respaldado por un archivo local."""
+
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+
+    @property
+    def path(self):
+        return os.path.join(self.bucket.root, *self.name.split("/"))
+
+    @property
+    def updated(self):
+        if not os.path.exists(self.path):
+            return None
+        return datetime.fromtimestamp(os.path.getmtime(self.path), tz=timezone.utc)
+
+    @property
+    def size(self):
+        if not os.path.exists(self.path):
+            return None
+        return os.path.getsize(self.path)
+
+    @property
+    def md5_hash(self):
+        # Mismo formato que GCS: MD5 del contenido codificado en base64
+        if not os.path.exists(self.path):
+            return None
+        digest = hashlib.md5()
+        with open(self.path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        return base64.b64encode(digest.digest()).decode("ascii")
+
+    def exists(self):
+        self.bucket._request("exists")
+        return os.path.isfile(self.path)
+
+    def download_to_filename(self, filename):
+        self.bucket._request("download")
+        if not os.path.isfile(self.path):
+            raise FileNotFoundError(f"No existe el blob local '{self.name}'")
+        shutil.copyfile(self.path, filename)
+
+    def download_as_bytes(self):
+        self.bucket._request("download")
+        if not os.path.isfile(self.path):
+            raise FileNotFoundError(f"No existe el blob local '{self.name}'")
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    # GCS mantiene este alias histórico que devuelve bytes
+    download_as_string = download_as_bytes
+
+    def download_as_text(self, encoding="utf-8"):
+        return self.download_as_bytes().decode(encoding)
+
+    def _write_atomic(self, data):
+        # Escribimos en un temporal y renombramos para que otros procesos
+        # nunca lean un archivo a medio escribir.
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path), prefix=".tmp-")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, self.path)
+
+    def upload_from_filename(self, filename, content_type=None):
+        self.bucket._request("upload")
+        with open(filename, "rb") as f:
+            self._write_atomic(f.read())
+
+    def upload_from_string(self, data, content_type=None):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        self.bucket._request("upload")
+        self._write_atomic(data)
+
+    def delete(self):
+        self.bucket._request("delete")
+        os.remove(self.path)
+
+    def generate_signed_url(self, **kwargs):
+        # En local no hay firma: devolvemos una URI file:// equivalente
+        self.bucket._request("sign_url")
+        return f"file://{os.path.abspath(self.path)}"
+
+
+def _glob_to_regex(pattern):
+    """Traduce un match_glob de GCS (`**`, `*`, `?`, `[...]`, `{a,b}`) a una expresión regular."""
+    regex = ""
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if pattern.startswith("**", i):
+            regex += ".*"
+            i += 2
+            continue
+        if c == "*":
+            regex += "[^/]*"
+        elif c == "?":
+            regex += "[^/]"
+        elif c == "[":
+            end = pattern.index("]", i + 1)
+            chars = pattern[i + 1:end]
+            regex += "[^" + chars[1:] + "]" if chars.startswith("!") else "[" + chars + "]"
+            i = end
+        elif c == "{":
+            end = pattern.index("}", i + 1)
+            regex += "(?:" + "|".join(re.escape(p) for p in pattern[i + 1:end].split(",")) + ")"
+            i = end
+        else:
+            regex += re.escape(c)
+        i += 1
+    return re.compile(regex + r"\Z")
+
+
+class LocalBucket:
+    """Objeto equivalente a `storage.Bucket` respaldado por un directorio."""
+
+    def __init__(self, root, name="local", on_request=None):
+        self.root = root
+        self.name = name
+        self.on_request = on_request
+
+    def _request(self, operation):
+        if self.on_request is not None:
+            self.on_request(operation)
+
+    def blob(self, blob_name):
+        return LocalBlob(self, blob_name)
+
+    def get_blob(self, blob_name):
+        blob = self.blob(blob_name)
+        return blob if blob.exists() else None
+
+    def list_blobs(self, prefix="", start_offset=None, page_size=None, match_glob=None):
+        # El listado ya es perezoso; page_size solo decide cuántas "peticiones" se hacen
+        page_size = page_size or DEFAULT_LIST_PAGE_SIZE
+        glob_re = _glob_to_regex(match_glob) if match_glob else None
+        # Solo recorremos el directorio que contiene el prefijo, no todo el bucket
+        walk_root = os.path.join(self.root, *prefix.split("/")[:-1])
+        names = []
+        for dirpath, _, filenames in os.walk(walk_root):
+            for filename in filenames:
+                if filename.startswith(".tmp-"):
+                    continue
+                rel_path = os.path.relpath(os.path.join(dirpath, filename), self.root)
+                name = rel_path.replace(os.sep, "/")
+                if name.startswith(prefix) and (start_offset is None or name >= start_offset):
+                    if glob_re is None or glob_re.match(name):
+                        names.append(name)
+        self._request("list")
+        for position, name in enumerate(sorted(names)):
+            if position and position % page_size == 0:
+                self._request("list")
+            yield LocalBlob(self, name)
+
+
+class LocalStorageClient:
+    """Objeto equivalente a `storage.Client`: cada bucket es un subdirectorio de `root`."""
+
+    def __init__(self, root, on_request=None):
+        self.root = root
+        self.on_request = on_request
+
+    def bucket(self, bucket_name):
+        return LocalBucket(os.path.join(self.root, bucket_name), bucket_name, self.on_request)
+
+    def list_blobs(self, bucket_or_name, prefix="", start_offset=None, page_size=None, match_glob=None):
+        bucket = bucket_or_name if isinstance(bucket_or_name, LocalBucket) else self.bucket(bucket_or_name)
+        return bucket.list_blobs(prefix=prefix, start_offset=start_offset, page_size=page_size, match_glob=match_glob)
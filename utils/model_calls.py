@@ -0,0 +1,120 @@
+# model_calls.py
+"""
+Control de las llamadas a los modelos de Vertex AI dentro del proceso.
+
+- Coalescencia (singleflight): si llega una petición idéntica a otra que ya
+  está en curso (p.ej. la misma pregunta de varios técnicos al empezar el
+  turno), espera el resultado de la primera en lugar de repetir la llamada.
+- Límite de concurrencia por modelo: cada modelo tiene un semáforo con
+  `config.MODEL_MAX_CONCURRENCY` huecos. Las llamadas que no consiguen hueco
+  en `config.MODEL_QUEUE_TIMEOUT_S` fallan con ModelBusyError en lugar de
+  sumar más peticiones a la cuota de Vertex.
+"""
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from contextlib import contextmanager
+
+from . import config
+
+
+class ModelBusyError(TimeoutError):
+    """No hubo hueco libre para llamar al modelo dentro del tiempo de espera."""
+
+
+_semaphores = {}
+_semaphores_lock = threading.Lock()
+
+_in_flight = {}
+_in_flight_lock = threading.Lock()
+
+
+def _get_semaphore(model_name):
+    with _semaphores_lock:
+        if model_name not in _semaphores:
+            limit = config.MODEL_MAX_CONCURRENCY.get(model_name, config.MODEL_DEFAULT_MAX_CONCURRENCY)
+            _semaphores[model_name] = threading.BoundedSemaphore(limit)
+        return _semaphores[model_name]
+
+
+def _acquire_slot(model_name, timeout=None):
+    semaphore = _get_semaphore(model_name)
+    timeout = config.MODEL_QUEUE_TIMEOUT_S if timeout is None else timeout
+    if not semaphore.acquire(timeout=timeout):
+        raise ModelBusyError(f"El modelo '{model_name}' está saturado (sin hueco tras {timeout}s).")
+    return semaphore
+
+
+@contextmanager
+def model_slot(model_name, timeout=None):
+    """Reserva un hueco del modelo, esperando en cola como mucho `timeout` segundos."""
+    semaphore = _acquire_slot(model_name, timeout)
+    try:
+        yield
+    finally:
+        semaphore.release()
+
+
+def limited_call(model_name, fn, *args, **kwargs):
+    """Ejecuta `fn` ocupando un hueco de concurrencia de `model_name`."""
+    with model_slot(model_name):
+        return fn(*args, **kwargs)
+
+
+def bounded_call(model_name, timeout, fn, *args, **kwargs):
+    """
+    Como `limited_call`, pero deja de esperar a `fn` tras `timeout` segundos con
+    ModelBusyError. La llamada sigue en un hilo auxiliar y conserva su hueco hasta
+    que termina, así que una llamada colgada no bloquea al llamador ni se salta
+    el límite de concurrencia.
+    """
+    semaphore = _acquire_slot(model_name)
+    future = Future()
+
+    def run():
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            semaphore.release()
+
+    threading.Thread(target=run, name=f"model-call-{model_name}", daemon=True).start()
+    try:
+        return future.result(timeout=timeout)
+    except FutureTimeoutError:
+        if future.done():
+            # Error propio de la llamada (p.ej. un ModelBusyError anidado): se propaga tal cual
+            raise
+        raise ModelBusyError(f"El modelo '{model_name}' no respondió en {timeout}s.") from None
+
+
+def coalesced_call(key, fn, *args, **kwargs):
+    """
+    Ejecuta `fn` una sola vez para todas las peticiones concurrentes con la misma
+    `key`. Todas reciben el mismo resultado (o la misma excepción), así que no
+    deben modificarlo.
+    """
+    with _in_flight_lock:
+        future = _in_flight.get(key)
+        is_leader = future is None
+        if is_leader:
+            future = Future()
+            _in_flight[key] = future
+
+    if not is_leader:
+        try:
+            return future.result(timeout=config.MODEL_CALL_TIMEOUT_S)
+        except FutureTimeoutError:
+            # La petición original sigue en curso: para el llamador es lo mismo que un modelo saturado
+            raise ModelBusyError(
+                f"La petición idéntica en curso no terminó en {config.MODEL_CALL_TIMEOUT_S}s."
+            ) from None
+
+    try:
+        future.set_result(fn(*args, **kwargs))
+    except BaseException as e:
+        future.set_exception(e)
+    finally:
+        with _in_flight_lock:
+            del _in_flight[key]
+    return future.result()
@@ -0,0 +1,50 @@
+# pipeline.py
+"""
+Orquestación enrutado → herramienta → RAG sin Streamlit.
+
+`ChatPipeline` recibe cada etapa como una función, de modo que la app y el
+driver de carga (utils/load_test.py) usan las mismas etapas; el driver solo
+sustituye GCS y Vertex AI por backends falsos con latencia inyectada. Todas las herramientas devuelven el
+mismo formato de resultado: {"type": "message" | "link" | "image" | "file_list"
+| "warning" | "error", "content": ..., ...}.
+"""
+import time
+
+UNKNOWN_INTENTION_MESSAGE = "Lo siento, no he podido entender tu solicitud. ¿Puedes reformularla?"
+
+
+class ChatPipeline:
+    def __init__(self, route, find_file, list_files, answer):
+        # route(query) -> decisión; find_file/list_files(detalles) -> resultado; answer(pregunta) -> resultado
+        self.route = route
+        self.find_file = find_file
+        self.list_files = list_files
+        self.answer = answer
+
+    def run_tool(self, decision, query):
+        """Ejecuta la herramienta que corresponde a la intención decidida."""
+        intention = decision.get("intencion")
+        details = decision.get("detalles", {})
+        if intention == "find_specific_file":
+            return self.find_file(details)
+        if intention == "list_files_in_folder":
+            return self.list_files(details)
+        if intention == "search_knowledge_base":
+            return self.answer(details.get("question", query))
+        return {"type": "message", "content": UNKNOWN_INTENTION_MESSAGE}
+
+    def run(self, query):
+        """
+        Procesa una consulta completa y mide cada etapa. Devuelve un diccionario con
+        la decisión, el resultado y los tiempos en segundos por etapa
+        ("routing" y el nombre de la intención).
+        """
+        timings = {}
+        start = time.perf_counter()
+        decision = self.route(query)
+        timings["routing"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        result = self.run_tool(decision, query)
+        timings[decision.get("intencion") or "unknown"] = time.perf_counter() - start
+        return {"decision": decision, "result": result, "timings": timings}
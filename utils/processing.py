@@ -1,30 +1,147 @@
 # processing.py
 import io
+import gzip
 import json
+import base64
 import tempfile
 import time
 import os
+import fitz
 from google.cloud import storage
-from langchain_community.document_loaders import PyMuPDFLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_google_vertexai import VertexAIEmbeddings
 from langchain_community.vectorstores import FAISS
+from langchain.schema import Document
 
 from . import config
+from . import index_artifacts
+from .corpora import get_corpus
 
-def get_current_pdf_state(storage_client, bucket):
+# Archivos que genera FAISS.save_local y que forman el índice publicado
+INDEX_FILENAMES = ["index.faiss", "index.pkl"]
+# Se incrementa si cambia el formato o el extractor, para no reutilizar cachés antiguas
+EXTRACTION_CACHE_VERSION = "v2"
+
+def is_indexable_pdf(blob_name, image_folder=config.IMAGE_FOLDER_PREFIX):
+    """Indica si un blob es un PDF que debe entrar en el índice (se excluye la carpeta de fotos)."""
+    return blob_name.lower().endswith(".pdf") and not blob_name.startswith(image_folder)
+
+def get_current_pdf_state(storage_client, bucket, corpus=None):
     """Obtiene el estado actual de los PDFs en GCS (nombre y fecha de modificación)."""
+    corpus = corpus or get_corpus()
     pdf_state = {}
-    blobs = storage_client.list_blobs(bucket, prefix=config.ROOT_GCS_FOLDER)
+    blobs = storage_client.list_blobs(bucket, prefix=corpus["root_folder"])
     for blob in blobs:
-        if blob.name.lower().endswith(".pdf") and not blob.name.startswith(config.IMAGE_FOLDER_PREFIX):
+        if is_indexable_pdf(blob.name, corpus["image_folder"]):
             pdf_state[blob.name] = blob.updated.isoformat()
     return pdf_state
 
-def get_last_processed_state(bucket):
+def extraction_cache_blob_name(blob, cache_folder=config.GLOBAL_JSON_GCS_FOLDER):
+    """Ruta de la extracción cacheada de un PDF, identificada por el checksum de su contenido."""
+    checksum = base64.b64decode(blob.md5_hash).hex()
+    return f"{cache_folder}{checksum}.{EXTRACTION_CACHE_VERSION}.jsonl.gz"
+
+def extract_pdf(pdf_bytes, source_name, with_blocks=True):
+    """
+    Extrae un PDF en una sola pasada de PyMuPDF. Devuelve sus páginas como
+    Documents (mismo texto y metadatos que PyMuPDFLoader, sin la ruta temporal) y,
+    con `with_blocks`, los bloques de texto e imagen de cada página:
+    [x0, y0, x1, y1, tipo (0 texto, 1 imagen), texto], con coordenadas en puntos.
+    """
+    docs, page_blocks = [], []
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as pdf:
+        pdf_metadata = {k: v for k, v in (pdf.metadata or {}).items() if type(v) in (str, int)}
+        for page in pdf:
+            # El texto plano y los bloques salen del mismo análisis de la página
+            textpage = page.get_textpage()
+            metadata = {"source": source_name, "page": page.number, "total_pages": len(pdf), **pdf_metadata}
+            docs.append(Document(page_content=page.get_text(textpage=textpage), metadata=metadata))
+            if with_blocks:
+                page_blocks.append([
+                    [round(x0, 1), round(y0, 1), round(x1, 1), round(y1, 1), block_type, text]
+                    for x0, y0, x1, y1, text, _, block_type in page.get_text("blocks", textpage=textpage)
+                ])
+    return docs, page_blocks
+
+def _read_extraction_cache(cache_blob, source_name):
+    docs = []
+    with gzip.GzipFile(fileobj=io.BytesIO(cache_blob.download_as_bytes())) as f:
+        for line in f:
+            page = json.loads(line)
+            metadata = {**page["metadata"], "source": source_name}
+            docs.append(Document(page_content=page["text"], metadata=metadata))
+    return docs
+
+def _write_extraction_cache(cache_blob, docs, page_blocks):
+    # Una línea por página: texto, metadatos de PyMuPDF (número de página, total, formato...)
+    # sin la fuente, que depende de dónde esté el PDF en el bucket, y los bloques de
+    # maquetación. Los bloques no pasan a los Document para no inflar el docstore.
+    lines = []
+    for doc in docs:
+        metadata = {k: v for k, v in doc.metadata.items() if k != "source"}
+        page = metadata.get("page")
+        blocks = page_blocks[page] if isinstance(page, int) and page < len(page_blocks) else []
+        lines.append(json.dumps({"text": doc.page_content, "metadata": metadata, "blocks": blocks}, ensure_ascii=False))
+    data = gzip.compress(("\n".join(lines) + "\n").encode("utf-8"))
+    cache_blob.upload_from_string(data, content_type="application/gzip")
+
+def load_pdf_blob(blob, bucket=None, cache_folder=config.GLOBAL_JSON_GCS_FOLDER):
+    """
+    Devuelve las páginas de un PDF como Documents. Si se pasa `bucket`, reutiliza
+    la extracción guardada en `cache_folder` cuando el contenido no ha cambiado
+    y, si no existe, la guarda tras extraerla con PyMuPDF.
+    """
+    cache_blob = None
+    if bucket is not None and blob.md5_hash:
+        cache_blob = bucket.blob(extraction_cache_blob_name(blob, cache_folder))
+        try:
+            if cache_blob.exists():
+                return _read_extraction_cache(cache_blob, blob.name)
+        except Exception as e:
+            print(f"No se pudo leer la extracción cacheada de {blob.name}: {e}")
+
+    docs, page_blocks = extract_pdf(blob.download_as_bytes(), blob.name, with_blocks=cache_blob is not None)
+
+    if cache_blob is not None:
+        try:
+            _write_extraction_cache(cache_blob, docs, page_blocks)
+        except Exception as e:
+            print(f"No se pudo guardar la extracción de {blob.name}: {e}")
+    return docs
+
+def split_documents(docs):
+    """Divide las páginas en fragmentos con los parámetros comunes de config."""
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=config.CHUNK_SIZE, chunk_overlap=config.CHUNK_OVERLAP)
+    return text_splitter.split_documents(docs)
+
+def index_exists(bucket, gcs_folder=config.FAISS_INDEX_GCS_FOLDER):
+    """Comprueba si hay un índice publicado, en partes comprimidas o en el formato antiguo de dos archivos."""
+    if index_artifacts.artifacts_exist(bucket, gcs_folder):
+        return True
+    return bucket.blob(f"{gcs_folder}index.faiss").exists()
+
+def upload_vector_store(bucket, vector_store, gcs_folder=config.FAISS_INDEX_GCS_FOLDER):
+    """Guarda el índice FAISS en un directorio temporal y lo publica en partes comprimidas en `gcs_folder`."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        vector_store.save_local(temp_dir)
+        return index_artifacts.publish_artifacts(bucket, temp_dir, INDEX_FILENAMES, gcs_folder)
+
+def download_vector_store(bucket, embeddings, gcs_folder=config.FAISS_INDEX_GCS_FOLDER):
+    """Descarga el índice FAISS de `gcs_folder` y lo carga en memoria."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        if index_artifacts.artifacts_exist(bucket, gcs_folder):
+            index_artifacts.fetch_artifacts(bucket, temp_dir, gcs_folder)
+        else:
+            # Índices publicados antes del formato en partes
+            for filename in INDEX_FILENAMES:
+                blob = bucket.blob(f"{gcs_folder}{filename}")
+                blob.download_to_filename(os.path.join(temp_dir, filename))
+        return FAISS.load_local(temp_dir, embeddings, allow_dangerous_deserialization=True)
+
+def get_last_processed_state(bucket, corpus=None):
     """Lee el manifiesto desde GCS para saber qué se procesó la última vez."""
     try:
-        manifest_path = f"{config.FAISS_INDEX_GCS_FOLDER}{config.PROCESSED_FILES_MANIFEST}"
+        manifest_path = (corpus or get_corpus())["manifest_path"]
         blob = bucket.blob(manifest_path)
         if not blob.exists():
             return {} # No hay manifiesto, es la primera vez
@@ -34,17 +151,18 @@ def get_last_processed_state(bucket):
         print(f"No se pudo leer el manifiesto anterior: {e}")
         return {} # Tratar como si fuera la primera vez
 
-def process_and_upload_index(st_status_container):
+def process_and_upload_index(st_status_container, corpus_name=None):
     """
     Función principal de procesamiento. Compara estados, procesa PDFs si es necesario,
-    y sube el nuevo índice y manifiesto a GCS.
+    y sube el nuevo índice y manifiesto del corpus a GCS.
     """
+    corpus = get_corpus(corpus_name)
     storage_client = storage.Client(project=config.PROJECT_ID)
-    bucket = storage_client.bucket(config.BUCKET_NAME)
+    bucket = storage_client.bucket(corpus["bucket"])
 
     st_status_container.update(label="Paso 1/5: Verificando cambios en los PDFs de GCS...", state="running")
-    current_state = get_current_pdf_state(storage_client, bucket)
-    last_state = get_last_processed_state(bucket)
+    current_state = get_current_pdf_state(storage_client, bucket, corpus)
+    last_state = get_last_processed_state(bucket, corpus)
 
     if not current_state:
         st_status_container.update(label="No se encontraron PDFs en la ruta especificada. Proceso detenido.", state="error", expanded=True)
@@ -63,20 +181,13 @@ def process_and_upload_index(st_status_container):
     
     for i, blob in enumerate(pdf_blobs_to_process):
         try:
-            with tempfile.NamedTemporaryFile(suffix=".pdf", delete=True) as temp_pdf:
-                blob.download_to_filename(temp_pdf.name)
-                loader = PyMuPDFLoader(temp_pdf.name)
-                docs = loader.load()
-                for doc in docs:
-                    doc.metadata["source"] = blob.name
-                all_docs.extend(docs)
+            all_docs.extend(load_pdf_blob(blob, bucket, corpus["extraction_folder"]))
             # Actualiza el estado en la UI
             st_status_container.update(label=f"Paso 2/5: Cargando PDFs... ({i+1}/{len(pdf_blobs_to_process)}) - {os.path.basename(blob.name)}", state="running")
         except Exception as e:
             print(f"Error procesando {blob.name}: {e}")
 
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1500, chunk_overlap=150)
-    chunks = text_splitter.split_documents(all_docs)
+    chunks = split_documents(all_docs)
 
     st_status_container.update(label=f"Paso 3/5: Creando embeddings para {len(chunks)} fragmentos de texto...", state="running")
     embeddings = VertexAIEmbeddings(model_name=config.EMBEDDING_MODEL_NAME, project=config.PROJECT_ID)
@@ -87,15 +198,10 @@ def process_and_upload_index(st_status_container):
     print(f"Índice FAISS creado en {end_time - start_time:.2f} segundos.")
 
     st_status_container.update(label="Paso 4/5: Guardando y subiendo el nuevo índice a GCS...", state="running")
-    with tempfile.TemporaryDirectory() as temp_dir:
-        vector_store.save_local(temp_dir)
-        for filename in ["index.faiss", "index.pkl"]:
-            gcs_path = f"{config.FAISS_INDEX_GCS_FOLDER}{filename}"
-            blob_to_upload = bucket.blob(gcs_path)
-            blob_to_upload.upload_from_filename(os.path.join(temp_dir, filename))
+    upload_vector_store(bucket, vector_store, gcs_folder=corpus["index_folder"])
 
     # --- Guardar el nuevo manifiesto ---
-    manifest_blob = bucket.blob(f"{config.FAISS_INDEX_GCS_FOLDER}{config.PROCESSED_FILES_MANIFEST}")
+    manifest_blob = bucket.blob(corpus["manifest_path"])
     manifest_blob.upload_from_string(json.dumps(current_state, indent=2), content_type="application/json")
     
     st_status_container.update(label="Paso 5/5: ¡Proceso completado con éxito!", state="complete", expanded=False)
@@ -0,0 +1,155 @@
+# query_batcher.py
+"""
+Micro-batching de consultas RAG entre sesiones.
+
+Streamlit atiende cada sesión en un hilo del mismo proceso, así que todas
+comparten la cadena RAG residente en utils/index_registry.py. En lugar de que cada
+pregunta haga su propia llamada de embeddings y su propia búsqueda FAISS, el
+`QueryBatcher` junta las preguntas que llegan en una ventana de pocos
+milisegundos, hace una sola llamada de embeddings y una sola búsqueda matricial
+en FAISS, y reparte los resultados a cada llamador.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Any, List
+
+import faiss
+import numpy as np
+from langchain.schema import Document
+from langchain.schema.retriever import BaseRetriever
+
+from . import config
+from . import model_calls
+from .lru_cache import LRUCache
+from .query_log import normalize
+
+
+class QueryBatcher:
+    """Agrupa búsquedas concurrentes sobre un mismo índice FAISS."""
+
+    def __init__(self, vector_store, embeddings, k=None, max_wait_ms=None, max_batch_size=None):
+        self.vector_store = vector_store
+        self.embeddings = embeddings
+        self.k = k or config.RAG_RETRIEVER_K
+        self.max_wait = (max_wait_ms if max_wait_ms is not None else config.QUERY_BATCH_MAX_WAIT_MS) / 1000
+        self.max_batch_size = max_batch_size or config.QUERY_BATCH_MAX_SIZE
+        self._queue = queue.Queue()
+        self._closed = False
+        # Ordena close() frente a los encolados: nada puede quedar detrás de la señal de parada
+        self._close_lock = threading.Lock()
+        # Embeddings de consultas ya vistas, por texto normalizado
+        self._embedding_cache = LRUCache(config.EMBEDDING_CACHE_SIZE)
+        self._worker = threading.Thread(target=self._run, name="query-batcher", daemon=True)
+        self._worker.start()
+
+    def search(self, query, timeout=None):
+        """Encola la consulta y bloquea hasta tener sus documentos."""
+        # Si la misma consulta ya está en curso (en este lote o en el anterior), esperamos su resultado
+        return model_calls.coalesced_call(("retrieval", id(self), query), self._enqueue_and_wait, query, timeout)
+
+    def close(self):
+        """
+        Detiene el hilo del batcher tras atender las consultas ya encoladas. Las
+        sesiones que aún tengan la cadena de un índice descargado siguen pudiendo
+        buscar: sus consultas se resuelven en su propio hilo, sin agrupar.
+        """
+        with self._close_lock:
+            self._closed = True
+            self._queue.put(None)
+
+    def _enqueue_and_wait(self, query, timeout):
+        future = Future()
+        with self._close_lock:
+            closed = self._closed
+            if not closed:
+                self._queue.put((query, future))
+        if closed:
+            self._process([(query, future)])
+        timeout = timeout or config.QUERY_BATCH_TIMEOUT_S
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            if future.done():
+                raise
+            # El lote sigue en curso: para el llamador es lo mismo que un modelo saturado
+            raise model_calls.ModelBusyError(f"La búsqueda no terminó en {timeout}s.") from None
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.max_wait
+            stop = False
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                # None es la señal de close(): procesamos lo que ya estaba encolado y salimos
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            self._process(batch)
+            if stop:
+                return
+
+    def _embed_queries(self, texts):
+        # Un único hilo atiende todos los lotes: la llamada se acota para que una colgada no pare las búsquedas
+        timeout = config.EMBEDDING_CALL_TIMEOUT_S
+        # VertexAIEmbeddings permite fijar el tipo de tarea de consulta en una llamada por lotes
+        if hasattr(self.embeddings, "embed"):
+            return model_calls.bounded_call(
+                config.EMBEDDING_MODEL_NAME, timeout, self.embeddings.embed, texts, embeddings_task_type="RETRIEVAL_QUERY"
+            )
+        return model_calls.bounded_call(config.EMBEDDING_MODEL_NAME, timeout, self.embeddings.embed_documents, texts)
+
+    def _docs_for(self, row):
+        docs = []
+        for index_position in row:
+            # FAISS rellena con -1 cuando hay menos de k vectores
+            if index_position == -1:
+                continue
+            docstore_id = self.vector_store.index_to_docstore_id[index_position]
+            docs.append(self.vector_store.docstore.search(docstore_id))
+        return docs
+
+    def _process(self, batch):
+        try:
+            # Preguntas idénticas dentro del lote se resuelven una sola vez
+            unique_queries = list(dict.fromkeys(query for query, _ in batch))
+            vectors = {query: self._embedding_cache.get(normalize(query)) for query in unique_queries}
+            missing = [query for query, vector in vectors.items() if vector is None]
+            if missing:
+                for query, vector in zip(missing, self._embed_queries(missing)):
+                    self._embedding_cache.put(normalize(query), vector)
+                    vectors[query] = vector
+            matrix = np.asarray([vectors[query] for query in unique_queries], dtype=np.float32)
+            if getattr(self.vector_store, "_normalize_L2", False):
+                faiss.normalize_L2(matrix)
+            _, indices = self.vector_store.index.search(matrix, self.k)
+            results = {query: self._docs_for(row) for query, row in zip(unique_queries, indices)}
+            print(f"[BATCHER] Lote de {len(batch)} consultas ({len(unique_queries)} únicas, {len(missing)} sin caché).")
+            for query, future in batch:
+                future.set_result(results[query])
+        except Exception as e:
+            print(f"[BATCHER] Error procesando un lote de {len(batch)} consultas: {e}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+
+
+class BatchedRetriever(BaseRetriever):
+    """Retriever de LangChain que delega en un `QueryBatcher` compartido."""
+
+    batcher: Any
+
+    def _get_relevant_documents(self, query: str, *, run_manager=None) -> List[Document]:
+        return self.batcher.search(query)
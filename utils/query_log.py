@@ -0,0 +1,107 @@
+# query_log.py
+"""
+Registro anónimo de frecuencia de preguntas.
+
+Solo se guarda el texto normalizado de la pregunta y cuántas veces se ha
+hecho: sin sesión, usuario ni fecha, y con correos y números largos
+sustituidos. Cada instancia acumula en memoria y vuelca de vez en cuando un
+archivo delta a `config.QUERY_LOG_GCS_FOLDER`, así que varias instancias
+nunca escriben sobre el mismo blob. `top_queries` suma los deltas para el
+calentamiento de cachés y `compact_deltas` los funde en `counts.json`.
+"""
+import json
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+
+from . import config
+
+_EMAIL_RE = re.compile(r"[\w.+-]+@[\w-]+\.[\w.-]+")
+_LONG_NUMBER_RE = re.compile(r"\d{6,}")
+
+_pending = Counter()
+_pending_lock = threading.Lock()
+_last_flush = time.monotonic()
+
+
+def normalize(question):
+    """Forma canónica de una pregunta (minúsculas y espacios simples), usada también como clave de caché."""
+    return " ".join(question.lower().split())
+
+
+def anonymize(question):
+    text = normalize(question)
+    text = _EMAIL_RE.sub("<email>", text)
+    return _LONG_NUMBER_RE.sub("<num>", text)
+
+
+def _default_bucket():
+    from google.cloud import storage
+    return storage.Client(project=config.PROJECT_ID).bucket(config.BUCKET_NAME)
+
+
+def record(question, bucket=None):
+    """Suma una aparición de la pregunta y vuelca los contadores si toca."""
+    global _last_flush
+    text = anonymize(question)
+    if not text or len(text) > config.QUERY_LOG_MAX_QUESTION_CHARS:
+        return
+    with _pending_lock:
+        _pending[text] += 1
+        due = (
+            sum(_pending.values()) >= config.QUERY_LOG_FLUSH_EVERY
+            or time.monotonic() - _last_flush >= config.QUERY_LOG_FLUSH_INTERVAL_S
+        )
+        if not due:
+            return
+        counts = dict(_pending)
+        _pending.clear()
+        _last_flush = time.monotonic()
+    try:
+        flush(counts, bucket or _default_bucket())
+    except Exception as e:
+        print(f"[QUERY_LOG] No se pudo volcar el registro de preguntas: {e}")
+
+
+def flush(counts, bucket):
+    delta_name = f"{config.QUERY_LOG_GCS_FOLDER}deltas/{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}.json"
+    bucket.blob(delta_name).upload_from_string(json.dumps(counts, ensure_ascii=False), content_type="application/json")
+
+
+def _read_totals(bucket):
+    counts_blob = bucket.blob(f"{config.QUERY_LOG_GCS_FOLDER}counts.json")
+    totals = Counter(json.loads(counts_blob.download_as_bytes())) if counts_blob.exists() else Counter()
+    deltas = []
+    for delta in bucket.list_blobs(prefix=f"{config.QUERY_LOG_GCS_FOLDER}deltas/"):
+        try:
+            totals.update(json.loads(delta.download_as_bytes()))
+        except Exception as e:
+            # Otra instancia puede haberlo compactado (y borrado) entre el listado y la lectura
+            print(f"[QUERY_LOG] Se omite el delta {delta.name}: {e}")
+            continue
+        deltas.append(delta)
+    return counts_blob, totals, deltas
+
+
+def _write_compacted(counts_blob, totals, deltas):
+    if deltas:
+        counts_blob.upload_from_string(json.dumps(totals, ensure_ascii=False), content_type="application/json")
+        for delta in deltas:
+            delta.delete()
+
+
+def compact_deltas(bucket):
+    """Funde los deltas en counts.json y los borra. Devuelve cuántos deltas se fundieron."""
+    counts_blob, totals, deltas = _read_totals(bucket)
+    _write_compacted(counts_blob, totals, deltas)
+    return len(deltas)
+
+
+def top_queries(bucket, n, compact=False):
+    """Devuelve las `n` preguntas más frecuentes. Con `compact`, funde los deltas en counts.json."""
+    counts_blob, totals, deltas = _read_totals(bucket)
+    if compact:
+        _write_compacted(counts_blob, totals, deltas)
+    return [question for question, _ in totals.most_common(n)]
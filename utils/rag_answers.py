@@ -0,0 +1,71 @@
+# rag_answers.py
+"""
+Respuestas de la cadena RAG con caché y calentamiento.
+
+No depende de Streamlit: lo usan tanto la app como el pipeline sin interfaz
+(utils/pipeline.py) y el driver de pruebas de carga.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+from . import config
+from . import model_calls
+from . import query_log
+from .lru_cache import LRUCache
+
+# Respuestas RAG ya generadas, por (corpus, versión del índice, pregunta normalizada),
+# compartidas por todas las sesiones. Con la versión en la clave, una respuesta del índice
+# anterior que termine después de la sustitución nunca se sirve con el nuevo.
+answer_cache = LRUCache(config.ANSWER_CACHE_SIZE)
+
+
+def forget_corpus_answers(corpus, version=None):
+    """Descarta las respuestas cacheadas de un corpus (o solo las de una versión de su índice) para liberar memoria."""
+    answer_cache.remove_if(lambda key: key[0] == corpus and (version is None or key[1] == version))
+
+
+def answer_question(rag_chain, question, record=True, corpus=None, use_cache=True, version=None):
+    """
+    Responde con la cadena RAG usando la caché de respuestas; las preguntas
+    idénticas en curso comparten una sola respuesta. `version` es la del índice
+    de `rag_chain`. Con `use_cache=False` (pruebas de carga) siempre se ejecuta la cadena.
+    """
+    corpus = corpus or config.DEFAULT_CORPUS
+    if record:
+        query_log.record(question)
+    key = (corpus, version, query_log.normalize(question))
+    if use_cache:
+        cached = answer_cache.get(key)
+        if cached is not None:
+            return cached
+    answer = model_calls.coalesced_call(("rag",) + key, rag_chain.invoke, question)
+    if use_cache:
+        answer_cache.put(key, answer)
+    return answer
+
+def warm_caches(rag_chain, compact=False, corpus=None, version=None):
+    """
+    Precalcula embeddings y respuestas de las preguntas más frecuentes del registro,
+    llenando las cachés de embeddings del retriever y de respuestas.
+    """
+    try:
+        from google.cloud import storage
+        bucket = storage.Client(project=config.PROJECT_ID).bucket(config.BUCKET_NAME)
+        questions = query_log.top_queries(bucket, config.CACHE_WARM_TOP_N, compact=compact)
+    except Exception as e:
+        print(f"[WARMUP] No se pudo leer el registro de preguntas: {e}")
+        return 0
+    # Las preguntas con datos ocultados ya no son las originales: no tiene sentido responderlas
+    questions = [q for q in questions if "<email>" not in q and "<num>" not in q]
+
+    def warm_one(question):
+        try:
+            answer_question(rag_chain, question, record=False, corpus=corpus, version=version)
+            return True
+        except Exception as e:
+            print(f"[WARMUP] Error calentando '{question}': {e}")
+            return False
+
+    with ThreadPoolExecutor(max_workers=config.CACHE_WARM_WORKERS) as executor:
+        warmed = sum(executor.map(warm_one, questions))
+    print(f"[WARMUP] {warmed}/{len(questions)} preguntas frecuentes precalculadas.")
+    return warmed
@@ -0,0 +1,141 @@
+# rag_index.py
+"""
+Construcción de la cadena RAG de un corpus a partir de su índice publicado.
+
+No depende de Streamlit: la app la usa a través del registro de índices
+(utils/app_utils.py) y el driver de carga la construye con modelos falsos.
+El bucket se obtiene de `gcs_tools.storage_client`, así que sustituir ese
+cliente (p.ej. por un LocalStorageClient) basta para cargar el índice de otro
+sitio.
+"""
+from langchain_google_vertexai import VertexAIEmbeddings, ChatVertexAI
+from langchain.prompts import PromptTemplate
+from langchain.schema.runnable import RunnablePassthrough, RunnableParallel, RunnableLambda
+from langchain.schema.output_parser import StrOutputParser
+
+from . import config
+from . import context_assembly
+from . import gcs_tools
+from . import index_artifacts
+from . import model_calls
+from . import processing
+from . import query_batcher
+from .corpora import get_corpus
+from .index_registry import LoadedIndex, estimate_vector_store_bytes
+from .rag_answers import forget_corpus_answers, warm_caches
+
+# Sin sangría: cada espacio del prompt se paga en tokens en todas las llamadas
+RAG_PROMPT_TEMPLATE = (
+    "Eres un asistente experto. Responde la PREGUNTA basándote únicamente en el CONTEXTO.\n"
+    "Si la respuesta no está en el CONTEXTO, di \"No he encontrado información sobre eso en los documentos.\"\n"
+    "Cita la fuente indicada en cada línea del contexto si es posible (ej: 'Según el documento X.pdf...').\n"
+    "CONTEXTO:\n{context}\n"
+    "PREGUNTA: {question}\n"
+    "RESPUESTA:"
+)
+
+
+def _corpus_bucket(corpus):
+    return gcs_tools.storage_client.bucket(corpus["bucket"])
+
+
+def index_exists(corpus_name=None):
+    """Comprueba si el índice publicado del corpus existe."""
+    corpus = get_corpus(corpus_name)
+    return processing.index_exists(_corpus_bucket(corpus), corpus["index_folder"])
+
+
+def published_index_version(corpus_name=None):
+    try:
+        corpus = get_corpus(corpus_name)
+        return index_artifacts.published_version(_corpus_bucket(corpus), corpus["index_folder"])
+    except Exception as e:
+        print(f"No se pudo leer la versión publicada del índice: {e}")
+        return None
+
+
+def index_is_current(entry):
+    """Comprueba si la versión cargada sigue siendo la publicada (el registro lo llama desde su hilo de fondo)."""
+    try:
+        corpus = get_corpus(entry.name)
+        return index_artifacts.published_version(_corpus_bucket(corpus), corpus["index_folder"]) == entry.version
+    except Exception as e:
+        print(f"No se pudo comprobar la versión publicada del índice '{entry.name}': {e}")
+        return True
+
+
+def build_prompt_inputs(inputs):
+    """Convierte los documentos recuperados en el CONTEXTO compacto del prompt."""
+    context, stats = context_assembly.assemble_context(inputs["docs"], inputs["question"])
+    print(f"[RAG] Contexto: {stats['sources_used']}/{stats['documents']} fuentes, ~{stats['context_tokens']} tokens.")
+    return {"context": context, "question": inputs["question"]}
+
+
+def log_prompt_usage(message):
+    """Registra los tokens de prompt que informa Vertex AI y deja pasar la respuesta."""
+    usage = getattr(message, "usage_metadata", None) or {}
+    prompt_tokens = usage.get("input_tokens")
+    if prompt_tokens is None:
+        prompt_tokens = message.response_metadata.get("usage_metadata", {}).get("prompt_token_count")
+    print(f"[RAG] Tokens de prompt: {prompt_tokens}, tokens de respuesta: {usage.get('output_tokens')}")
+    return message
+
+
+def build_loaded_index(corpus_name, warm=True, compact_query_log=False, embeddings=None, llm=None):
+    """
+    Carga el índice del corpus y construye su cadena RAG completa. Devuelve un
+    `LoadedIndex`, o None si el corpus no tiene índice publicado; los errores
+    de descarga se propagan. Con `warm`, las cachés se calientan antes de
+    devolverlo, es decir, antes de que atienda tráfico. `embeddings` y `llm`
+    sustituyen a los modelos de Vertex AI (p.ej. en las pruebas de carga).
+    """
+    print(f"Iniciando la carga de la cadena RAG del corpus '{corpus_name}'...")
+    corpus = get_corpus(corpus_name)
+    bucket = _corpus_bucket(corpus)
+
+    # 1. Cargar el modelo de embeddings
+    embeddings = embeddings or VertexAIEmbeddings(**config.EMBEDDING_MODEL_CONFIG)
+
+    # 2. Cargar la base de datos de vectores (índice FAISS); la versión se lee antes de descargar,
+    # así que si se publica otra durante la descarga, la siguiente comprobación la recarga
+    if not processing.index_exists(bucket, corpus["index_folder"]):
+        print(f"El corpus '{corpus_name}' no tiene índice publicado. La cadena RAG no se puede construir.")
+        return None
+    version = published_index_version(corpus_name)
+    vector_store = processing.download_vector_store(bucket, embeddings, corpus["index_folder"])
+    print("Vector Store cargado. Construyendo el resto de la cadena RAG...")
+
+    # 3. Retriever compartido por todas las sesiones: agrupa embeddings y búsquedas concurrentes
+    batcher = query_batcher.QueryBatcher(vector_store, embeddings, k=config.RAG_RETRIEVER_K)
+    retriever = query_batcher.BatchedRetriever(batcher=batcher)
+
+    # 4. Crear el modelo de lenguaje para la respuesta
+    llm = llm or ChatVertexAI(**config.RAG_RESPONSE_LLM_CONFIG)
+    prompt = PromptTemplate(template=RAG_PROMPT_TEMPLATE, input_variables=["context", "question"])
+
+    # 5. Ensamblar el contexto con presupuesto de tokens en lugar de pasar los Document crudos
+    rag_chain = (
+        RunnableParallel(docs=retriever, question=RunnablePassthrough())
+        | RunnableLambda(build_prompt_inputs)
+        | prompt
+        | RunnableLambda(lambda prompt_value: model_calls.limited_call(
+            config.RAG_RESPONSE_LLM_CONFIG["model_name"], llm.invoke, prompt_value
+        ))
+        | RunnableLambda(log_prompt_usage)
+        | StrOutputParser()
+    )
+
+    print("Cadena RAG construida exitosamente.")
+
+    # 6. Calentar las cachés con las preguntas más frecuentes antes de atender tráfico
+    # (el registro de preguntas es el del corpus por defecto)
+    if warm and corpus_name == config.DEFAULT_CORPUS:
+        warm_caches(rag_chain, compact=compact_query_log, corpus=corpus_name, version=version)
+
+    def release():
+        batcher.close()
+        forget_corpus_answers(corpus_name, version)
+
+    return LoadedIndex(
+        corpus_name, rag_chain, estimate_vector_store_bytes(vector_store), on_close=release, version=version
+    )
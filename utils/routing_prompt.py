@@ -0,0 +1,351 @@
+# routing_prompt.py
+"""
+Constructor del prompt de enrutado con ejemplos few-shot dinámicos.
+
+El prompt original (LEGACY_ROUTING_PROMPT_TEMPLATE) enviaba en cada llamada los
+15 ejemplos y descripciones largas de las herramientas. Ahora las instrucciones
+son compactas y solo se incluyen los `config.ROUTING_NUM_EXAMPLES` ejemplos del
+banco más parecidos a la consulta, elegidos con un índice de embeddings de los
+ejemplos que se calcula una vez y se guarda en disco.
+
+Para medir la reducción de tokens sobre un archivo con una consulta por línea:
+    python -m utils.routing_prompt consultas.txt
+"""
+import hashlib
+import json
+import os
+import sys
+import threading
+
+import numpy as np
+
+from . import config
+from . import model_calls
+from .context_assembly import estimate_tokens
+from .lru_cache import LRUCache
+from .query_log import normalize
+
+ROUTING_INSTRUCTIONS = """Clasifica la solicitud del usuario en UNA intención y extrae sus detalles.
+Intenciones:
+- find_specific_file: pide un archivo concreto (foto, imagen, plano, PDF, manual) por su nombre o por palabras que lo identifican sin ambigüedad. detalles: {"file_keywords": "<palabras clave>"}
+- list_files_in_folder: pide una lista de lo que hay en una carpeta o categoría, o de un tipo de archivo (pdf, fotos, manuales). detalles: {"folder_name": "<carpeta o categoría>"}
+- search_knowledge_base: cualquier otra pregunta o solicitud ambigua (opción por defecto). detalles: {"question": "<pregunta original completa>"}
+Responde solo con JSON en una línea, sin texto adicional: {"intencion": "...", "detalles": {...}}
+Ejemplos:
+"""
+
+# Banco de ejemplos: se puede ampliar sin que crezca el prompt, solo se envían los más parecidos
+ROUTING_EXAMPLES = [
+    {"query": "dame la fotografia del CPU", "intencion": "find_specific_file", "detalles": {"file_keywords": "fotografia del CPU"}},
+    {"query": "muéstrame la imagen CPU.jpeg", "intencion": "find_specific_file", "detalles": {"file_keywords": "CPU.jpeg"}},
+    {"query": "necesito el contrato de arrendamiento", "intencion": "find_specific_file", "detalles": {"file_keywords": "contrato de arrendamiento"}},
+    {"query": "quiero ver el PDF de especificaciones", "intencion": "find_specific_file", "detalles": {"file_keywords": "PDF de especificaciones"}},
+    {"query": "baja el manual de usuario del modelo XZ-100", "intencion": "find_specific_file", "detalles": {"file_keywords": "manual de usuario del modelo XZ-100"}},
+    {"query": "lista los archivos pdf", "intencion": "list_files_in_folder", "detalles": {"folder_name": "pdf"}},
+    {"query": "muéstrame las fotos de la carpeta imágenes", "intencion": "list_files_in_folder", "detalles": {"folder_name": "imágenes"}},
+    {"query": "¿Qué planos están disponibles?", "intencion": "list_files_in_folder", "detalles": {"folder_name": "planos"}},
+    {"query": "todos los manuales que tengas", "intencion": "list_files_in_folder", "detalles": {"folder_name": "manuales"}},
+    {"query": "dime los reportes que hay", "intencion": "list_files_in_folder", "detalles": {"folder_name": "reportes"}},
+    {"query": "¿Cuál es el procedimiento de seguridad?", "intencion": "search_knowledge_base", "detalles": {"question": "¿Cuál es el procedimiento de seguridad?"}},
+    {"query": "Información sobre el nuevo proyecto", "intencion": "search_knowledge_base", "detalles": {"question": "Información sobre el nuevo proyecto"}},
+    {"query": "Tengo una duda general", "intencion": "search_knowledge_base", "detalles": {"question": "Tengo una duda general"}},
+    {"query": "Muéstrame todos los archivos", "intencion": "search_knowledge_base", "detalles": {"question": "Muéstrame todos los archivos"}},
+    {"query": "Necesito ayuda", "intencion": "search_knowledge_base", "detalles": {"question": "Necesito ayuda"}},
+]
+
+# Índices de embeddings de los ejemplos por modelo, cargados una vez por proceso
+_example_indexes = {}
+_example_index_lock = threading.Lock()
+# Vectores de consultas ya vistas, por (modelo, consulta normalizada)
+query_vector_cache = LRUCache(config.ROUTING_QUERY_CACHE_SIZE)
+
+# Prompt original con los 15 ejemplos fijos; solo se conserva como referencia para medir la reducción
+LEGACY_ROUTING_PROMPT_TEMPLATE = """
+Eres un asistente de inteligencia artificial especializado en la gestión y recuperación de documentos y en la consulta de una base de conocimiento. Tu tarea es analizar la solicitud del usuario en español e identificar la **intención más precisa** y extraer los **detalles clave** necesarios para ejecutar la acción.
+
+**Tu respuesta DEBE ser un objeto JSON válido y NADA MÁS. No incluyas explicaciones, comentarios, o texto adicional antes o después del JSON.**
+
+### Herramientas y sus Intenciones (ELIGE SIEMPRE LA MÁS ESPECÍFICA):
+
+1.  **`find_specific_file`**:
+    * **Propósito**: Recuperar un archivo *único y específico* del almacenamiento en la nube (GCS).
+    * **Criterio de Uso**: El usuario DEBE solicitar un archivo, documento, imagen, foto, plano, PDF o manual por su **nombre exacto** o con **palabras clave que lo identifiquen sin ambigüedad** (ej. "el plano de la fachada", "la factura de enero", "la imagen del CPU"). Si el usuario pide "la foto" de algo, y ese "algo" es el identificador principal, usa esta intención.
+    * **Parámetros**:
+        * `file_keywords`: **(STRING - OBLIGATORIO)** Las palabras clave o el nombre del archivo. No dejes esto vacío si usas esta intención.
+
+2.  **`list_files_in_folder`**:
+    * **Propósito**: Mostrar una *lista* de archivos contenidos *dentro de una carpeta o categoría* específica.
+    * **Criterio de Uso**: El usuario DEBE pedir una "lista", "qué hay", "todos los archivos", o "muéstrame las [tipo de archivo] de la carpeta [nombre de carpeta/categoría]". Se requiere que mencione una **categoría o tipo de archivo (ej. "PDFs", "fotos") O un nombre de carpeta** (ej. "manuales", "contratos").
+    * **Parámetros**:
+        * `folder_name`: **(STRING - OBLIGATORIO)** El nombre de la carpeta o la categoría de documentos. No dejes esto vacío si usas esta intención.
+
+3.  **`search_knowledge_base`**:
+    * **Propósito**: Responder a preguntas generales, proporcionar información conceptual o procedimental, o manejar solicitudes que NO sean explícitamente para obtener o listar archivos.
+    * **Criterio de Uso**: Esta es la **opción por defecto para cualquier consulta que NO encaje perfectamente** en `find_specific_file` o `list_files_in_folder`.
+        * **NO usar si la solicitud claramente pide un archivo específico o una lista de archivos en una carpeta.**
+        * **EJEMPLOS DE USO**: "¿Cómo se calibra X?", "Explícame sobre Y", "Información general de Z", "Tengo una pregunta sobre [tema]", "Cuál es el procedimiento para...", o solicitudes ambiguas de archivos como "dame archivos" (sin especificar qué o de dónde).
+    * **Parámetros**:
+        * `question`: **(STRING - OBLIGATORIO)** La pregunta original completa del usuario.
+
+Responde ÚNICAMENTE en formato JSON. No incluyas explicaciones, notas, o texto adicional antes o después del JSON.
+
+### Ejemplos Detallados para el Entrenamiento:
+
+**Caso 1: `find_specific_file` (Pedir un archivo CONCRETO)**
+* **Usuario**: "dame la fotografia del CPU"
+    **JSON**: ```json
+    {{
+        "intencion": "find_specific_file",
+        "detalles": {{
+            "file_keywords": "fotografia del CPU"
+        }}
+    }}
+    ```
+* **Usuario**: "muéstrame la imagen CPU.jpeg"
+    **JSON**: ```json
+    {{
+        "intencion": "find_specific_file",
+        "detalles": {{
+            "file_keywords": "CPU.jpeg"
+        }}
+    }}
+    ```
+* **Usuario**: "necesito el contrato de arrendamiento"
+    **JSON**: ```json
+    {{
+        "intencion": "find_specific_file",
+        "detalles": {{
+            "file_keywords": "contrato de arrendamiento"
+        }}
+    }}
+    ```
+* **Usuario**: "quiero ver el PDF de especificaciones"
+    **JSON**: ```json
+    {{
+        "intencion": "find_specific_file",
+        "detalles": {{
+            "file_keywords": "PDF de especificaciones"
+        }}
+    }}
+    ```
+* **Usuario**: "baja el manual de usuario del modelo XZ-100"
+    **JSON**: ```json
+    {{
+        "intencion": "find_specific_file",
+        "detalles": {{
+            "file_keywords": "manual de usuario del modelo XZ-100"
+        }}
+    }}
+    ```
+
+**Caso 2: `list_files_in_folder` (Pedir una LISTA de archivos de una CATEGORÍA/CARPETA)**
+* **Usuario**: "lista los archivos pdf"
+    **JSON**: ```json
+    {{
+        "intencion": "list_files_in_folder",
+        "detalles": {{
+            "folder_name": "pdf"
+        }}
+    }}
+    ```
+* **Usuario**: "muéstrame las fotos de la carpeta imágenes"
+    **JSON**: ```json
+    {{
+        "intencion": "list_files_in_folder",
+        "detalles": {{
+            "folder_name": "imágenes"
+        }}
+    }}
+    ```
+* **Usuario**: "¿Qué planos están disponibles?"
+    **JSON**: ```json
+    {{
+        "intencion": "list_files_in_folder",
+        "detalles": {{
+            "folder_name": "planos"
+        }}
+    }}
+    ```
+* **Usuario**: "todos los manuales que tengas"
+    **JSON**: ```json
+    {{
+        "intencion": "list_files_in_folder",
+        "detalles": {{
+            "folder_name": "manuales"
+        }}
+    }}
+    ```
+* **Usuario**: "dime los reportes que hay"
+    **JSON**: ```json
+    {{
+        "intencion": "list_files_in_folder",
+        "detalles": {{
+            "folder_name": "reportes"
+        }}
+    }}
+    ```
+
+**Caso 3: `search_knowledge_base` (Preguntas GENERALES o NO relacionadas con archivos Específicos/Listas)**
+* **Usuario**: "¿Cuál es el procedimiento de seguridad?"
+    **JSON**: ```json
+    {{
+        "intencion": "search_knowledge_base",
+        "detalles": {{
+            "question": "¿Cuál es el procedimiento de seguridad?"
+        }}
+    }}
+    ```
+* **Usuario**: "Información sobre el nuevo proyecto"
+    **JSON**: ```json
+    {{
+        "intencion": "search_knowledge_base",
+        "detalles": {{
+            "question": "Información sobre el nuevo proyecto"
+        }}
+    }}
+    ```
+* **Usuario**: "Tengo una duda general"
+    **JSON**: ```json
+    {{
+        "intencion": "search_knowledge_base",
+        "detalles": {{
+            "question": "Tengo una duda general"
+        }}
+    }}
+    ```
+* **Usuario**: "Muéstrame todos los archivos" (demasiado general, sin categoría/nombre específico)
+    **JSON**: ```json
+    {{
+        "intencion": "search_knowledge_base",
+        "detalles": {{
+            "question": "Muéstrame todos los archivos"
+        }}
+    }}
+    ```
+* **Usuario**: "Necesito ayuda"
+    **JSON**: ```json
+    {{
+        "intencion": "search_knowledge_base",
+        "detalles": {{
+            "question": "Necesito ayuda"
+        }}
+    }}
+    ```
+
+Pregunta del usuario: "{user_query}"
+Respuesta:
+"""
+
+
+def _embed(embeddings, texts):
+    # Con Vertex AI pedimos embeddings pensados para comparar frases entre sí
+    if hasattr(embeddings, "embed"):
+        vectors = model_calls.limited_call(
+            config.EMBEDDING_MODEL_NAME, embeddings.embed, texts, embeddings_task_type="SEMANTIC_SIMILARITY"
+        )
+    else:
+        vectors = model_calls.limited_call(config.EMBEDDING_MODEL_NAME, embeddings.embed_documents, texts)
+    matrix = np.asarray(vectors, dtype=np.float32)
+    # Normalizamos para que el producto escalar sea la similitud coseno
+    return matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+
+
+def _embeddings_model_name(embeddings):
+    return getattr(embeddings, "model_name", None) or type(embeddings).__name__
+
+
+def _example_index_path(embeddings):
+    # El nombre depende del modelo y de los ejemplos: si cambian, se recalcula el índice
+    fingerprint = json.dumps([_embeddings_model_name(embeddings), [e["query"] for e in ROUTING_EXAMPLES]], ensure_ascii=False)
+    digest = hashlib.sha1(fingerprint.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(config.ROUTING_EXAMPLE_INDEX_DIR, f"routing_examples_{digest}.npy")
+
+
+def get_example_index(embeddings):
+    """Matriz de embeddings normalizados del banco de ejemplos (de disco o calculada una vez)."""
+    path = _example_index_path(embeddings)
+    if path in _example_indexes:
+        return _example_indexes[path]
+
+    # Un solo hilo lo carga o lo calcula; los demás esperan y reutilizan el resultado
+    with _example_index_lock:
+        if path in _example_indexes:
+            return _example_indexes[path]
+        if os.path.exists(path):
+            example_index = np.load(path)
+        else:
+            print(f"[ROUTING] Calculando el índice de {len(ROUTING_EXAMPLES)} ejemplos de enrutado...")
+            example_index = _embed(embeddings, [e["query"] for e in ROUTING_EXAMPLES])
+            os.makedirs(config.ROUTING_EXAMPLE_INDEX_DIR, exist_ok=True)
+            # Otros procesos pueden leerlo a la vez: se escribe aparte y se sustituye de una vez
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                np.save(f, example_index)
+            os.replace(tmp_path, path)
+        _example_indexes[path] = example_index
+    return example_index
+
+
+def embed_query(user_query, embeddings):
+    """Vector normalizado de la consulta, reutilizando el de consultas ya enrutadas."""
+    key = (_embeddings_model_name(embeddings), normalize(user_query))
+    vector = query_vector_cache.get(key)
+    if vector is None:
+        vector = _embed(embeddings, [user_query])[0]
+        query_vector_cache.put(key, vector)
+    return vector
+
+
+def select_examples(user_query, embeddings, num_examples=None):
+    """Devuelve los ejemplos del banco más parecidos a la consulta."""
+    num_examples = num_examples or config.ROUTING_NUM_EXAMPLES
+    try:
+        index = get_example_index(embeddings)
+        query_vector = embed_query(user_query, embeddings)
+        best = np.argsort(-(index @ query_vector))[:num_examples]
+        return [ROUTING_EXAMPLES[i] for i in best]
+    except Exception as e:
+        # Sin embeddings seguimos funcionando con un ejemplo fijo de cada intención
+        print(f"[ROUTING] No se pudieron seleccionar ejemplos dinámicos: {e}")
+        return [ROUTING_EXAMPLES[0], ROUTING_EXAMPLES[5], ROUTING_EXAMPLES[10]]
+
+
+def _format_example(query, answer=None):
+    line = f"Usuario: {json.dumps(query, ensure_ascii=False)} ->"
+    if answer is not None:
+        line += " " + json.dumps(answer, ensure_ascii=False, separators=(",", ":"))
+    return line
+
+
+def build_routing_prompt(user_query, embeddings):
+    """Prompt compacto con las instrucciones y solo los ejemplos relevantes para `user_query`."""
+    examples = select_examples(user_query, embeddings)
+    lines = [
+        _format_example(e["query"], {"intencion": e["intencion"], "detalles": e["detalles"]})
+        for e in examples
+    ]
+    lines.append(_format_example(user_query))
+    return ROUTING_INSTRUCTIONS + "\n".join(lines)
+
+
+def measure_token_reduction(queries, embeddings):
+    """Compara los tokens estimados del prompt original y del dinámico sobre un conjunto de consultas."""
+    legacy_tokens = [estimate_tokens(LEGACY_ROUTING_PROMPT_TEMPLATE.format(user_query=q)) for q in queries]
+    dynamic_tokens = [estimate_tokens(build_routing_prompt(q, embeddings)) for q in queries]
+    legacy_avg = sum(legacy_tokens) / len(queries)
+    dynamic_avg = sum(dynamic_tokens) / len(queries)
+    return {
+        "queries": len(queries),
+        "legacy_avg_tokens": round(legacy_avg, 1),
+        "dynamic_avg_tokens": round(dynamic_avg, 1),
+        "reduction_pct": round(100 * (1 - dynamic_avg / legacy_avg), 1),
+    }
+
+
+if __name__ == "__main__":
+    from langchain_google_vertexai import VertexAIEmbeddings
+
+    with open(sys.argv[1], encoding="utf-8") as f:
+        query_set = [line.strip() for line in f if line.strip()]
+    report = measure_token_reduction(query_set, VertexAIEmbeddings(**config.EMBEDDING_MODEL_CONFIG))
+    print(json.dumps(report, indent=2))
@@ -1,34 +1,32 @@
 # build_index.py
-import os
-import io
-import tempfile
+import argparse
 import time
 from google.cloud import storage
-from langchain_community.document_loaders import PyMuPDFLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_google_vertexai import VertexAIEmbeddings
 from langchain_community.vectorstores import FAISS
 
 # Importamos la configuración central
 from . import config
+from . import query_log
+from .corpora import get_corpus
+from .processing import is_indexable_pdf, load_pdf_blob, split_documents, upload_vector_store
+from .thumbnails import generate_missing_derivatives
 
-def build_and_upload_index():
+def build_and_upload_index(corpus_name=None):
     """
-    Lee PDFs de GCS, los procesa en memoria, crea un índice FAISS
+    Lee PDFs del corpus en GCS, los procesa en memoria, crea un índice FAISS
     y sube los archivos del índice de vuelta a GCS.
     """
-    print("--- Iniciando Proceso de Indexación ---")
+    corpus = get_corpus(corpus_name)
+    print(f"--- Iniciando Proceso de Indexación del corpus '{corpus['name']}' ---")
     
     # 1. Conectar a GCS y listar los PDFs
     storage_client = storage.Client(project=config.PROJECT_ID)
-    bucket = storage_client.bucket(config.BUCKET_NAME)
+    bucket = storage_client.bucket(corpus["bucket"])
     
-    all_blobs = list(bucket.list_blobs(prefix=config.ROOT_GCS_FOLDER))
+    all_blobs = list(bucket.list_blobs(prefix=corpus["root_folder"]))
     
-    pdf_blobs = [
-        blob for blob in all_blobs 
-        if blob.name.lower().endswith(".pdf") and not blob.name.startswith(config.IMAGE_FOLDER_PREFIX)
-    ]
+    pdf_blobs = [blob for blob in all_blobs if is_indexable_pdf(blob.name, corpus["image_folder"])]
 
     if not pdf_blobs:
         print("¡Error! No se encontraron archivos PDF en la ruta especificada.")
@@ -41,28 +39,14 @@ def build_and_upload_index():
     print("Cargando y procesando PDFs desde GCS (esto puede tardar)...")
     for blob in pdf_blobs:
         try:
-            # Descargar el PDF a un stream de bytes en memoria
-            pdf_bytes = blob.download_as_bytes()
-            
-            # PyMuPDFLoader necesita un path, así que usamos un archivo temporal
-            with tempfile.NamedTemporaryFile(suffix=".pdf", delete=True) as temp_pdf:
-                temp_pdf.write(pdf_bytes)
-                temp_pdf.seek(0)
-                
-                loader = PyMuPDFLoader(temp_pdf.name)
-                docs = loader.load()
-                # Añadir la fuente (nombre del archivo) a la metadata de cada página
-                for doc in docs:
-                    doc.metadata["source"] = blob.name
-                all_docs.extend(docs)
+            all_docs.extend(load_pdf_blob(blob, bucket, corpus["extraction_folder"]))
             print(f" - Procesado: {blob.name}")
         except Exception as e:
             print(f"  - Error procesando {blob.name}: {e}")
 
     # 3. Dividir documentos en fragmentos (chunks)
     print("\nDividiendo documentos en fragmentos...")
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1500, chunk_overlap=150)
-    chunks = text_splitter.split_documents(all_docs)
+    chunks = split_documents(all_docs)
     print(f"Total de fragmentos creados: {len(chunks)}")
 
     # 4. Crear embeddings y el índice FAISS
@@ -78,20 +62,23 @@ def build_and_upload_index():
     # 5. Guardar el índice en GCS
     print("\nSubiendo el índice FAISS a Google Cloud Storage...")
     # FAISS.save_local crea dos archivos: index.faiss y index.pkl
-    # Los guardamos en un directorio temporal y de ahí los subimos a GCS
-    with tempfile.TemporaryDirectory() as temp_dir:
-        vector_store.save_local(temp_dir)
-        
-        # Subir index.faiss
-        blob_faiss = bucket.blob(f"{config.FAISS_INDEX_GCS_FOLDER}index.faiss")
-        blob_faiss.upload_from_filename(os.path.join(temp_dir, "index.faiss"))
-        
-        # Subir index.pkl
-        blob_pkl = bucket.blob(f"{config.FAISS_INDEX_GCS_FOLDER}index.pkl")
-        blob_pkl.upload_from_filename(os.path.join(temp_dir, "index.pkl"))
+    upload_vector_store(bucket, vector_store, gcs_folder=corpus["index_folder"])
     
     print("--- ¡Éxito! El índice ha sido construido y guardado en GCS. ---")
-    print(f"Ruta del índice en GCS: gs://{config.BUCKET_NAME}/{config.FAISS_INDEX_GCS_FOLDER}")
+    print(f"Ruta del índice en GCS: gs://{corpus['bucket']}/{corpus['index_folder']}")
+
+    # La app detecta la nueva versión y calienta sus cachés; el registro (del corpus por defecto) se compacta solo aquí
+    if corpus["name"] == config.DEFAULT_CORPUS:
+        try:
+            print(f"Registro de preguntas compactado ({query_log.compact_deltas(bucket)} deltas).")
+        except Exception as e:
+            print(f"No se pudo compactar el registro de preguntas: {e}")
+
+    # 6. Pre-generar miniaturas y vistas previas de las imágenes nuevas
+    print("\nGenerando derivados de las imágenes...")
+    generate_missing_derivatives(bucket, corpus)
 
 if __name__ == "__main__":
-    build_and_upload_index()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Indexa los PDFs de un corpus en un solo proceso.")
+    parser.add_argument("--corpus", default=config.DEFAULT_CORPUS)
+    build_and_upload_index(parser.parse_args().corpus)
\ No newline at end of file
@@ -0,0 +1,188 @@
+# thumbnails.py
+"""
+Derivados redimensionados (miniatura y vista previa) de las imágenes del bucket.
+
+Cada derivado se genera una sola vez: se guarda en GCS bajo la carpeta
+`thumbnail_folder` de su corpus y en una caché local en disco, limitada a
+`config.THUMBNAIL_LOCAL_CACHE_MAX_BYTES` (se borran los menos usados). El nombre
+incluye la versión del original, así que si la foto se reemplaza se genera uno nuevo.
+Se crean bajo demanda al mostrar una imagen o por adelantado con:
+    python -m utils.thumbnails [--corpus NOMBRE]
+"""
+import io
+import os
+import hashlib
+import threading
+
+from PIL import Image, ImageOps
+
+from . import config
+from .corpora import get_corpus
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif')
+# Al recortar la caché local se deja en esta fracción del máximo, para no recorrerla en cada escritura
+LOCAL_CACHE_LOW_WATERMARK = 0.8
+
+_local_cache_lock = threading.Lock()
+# Bytes ocupados por la caché local según este proceso; se calcula al primer uso
+_local_cache_bytes = None
+
+
+def is_image(blob_name):
+    return blob_name.lower().endswith(IMAGE_EXTENSIONS)
+
+
+def _source_version(blob):
+    # En GCS la generación cambia con cada sobrescritura; el sustituto local solo tiene fecha
+    generation = getattr(blob, "generation", None)
+    if generation:
+        return str(generation)
+    return str(int(blob.updated.timestamp()))
+
+
+def derivative_blob_name(source_blob, variant, corpus=None):
+    """Ruta en GCS del derivado `variant` de `source_blob`, dentro de las carpetas de su corpus."""
+    corpus = corpus or get_corpus()
+    relative_path = source_blob.name
+    if relative_path.startswith(corpus["root_folder"]):
+        relative_path = relative_path[len(corpus["root_folder"]):]
+    base, _ = os.path.splitext(relative_path)
+    return f"{corpus['thumbnail_folder']}{variant}/{base}.{_source_version(source_blob)}.jpg"
+
+
+def _local_cache_path(derivative_name):
+    digest = hashlib.sha1(derivative_name.encode("utf-8")).hexdigest()
+    return os.path.join(config.THUMBNAIL_LOCAL_CACHE_DIR, f"{digest}.jpg")
+
+
+def _local_cache_entries():
+    entries = []
+    for entry in os.scandir(config.THUMBNAIL_LOCAL_CACHE_DIR):
+        if not entry.name.endswith(".jpg"):
+            continue
+        try:
+            stat = entry.stat()
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, entry.path))
+    return entries
+
+
+def trim_local_cache(max_bytes=None):
+    """
+    Borra los derivados locales usados hace más tiempo (la fecha de modificación
+    se actualiza en cada uso) hasta dejar la caché por debajo del máximo.
+    Devuelve cuántos se borraron.
+    """
+    global _local_cache_bytes
+    max_bytes = max_bytes or config.THUMBNAIL_LOCAL_CACHE_MAX_BYTES
+    if not os.path.isdir(config.THUMBNAIL_LOCAL_CACHE_DIR):
+        return 0
+    entries = sorted(_local_cache_entries())
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    for _, size, path in entries:
+        if total <= max_bytes * LOCAL_CACHE_LOW_WATERMARK:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            # Otro proceso lo ha borrado a la vez
+            pass
+        total -= size
+        removed += 1
+    _local_cache_bytes = total
+    if removed:
+        print(f"[THUMBNAILS] Caché local recortada: {removed} derivados borrados, quedan ~{total / 2**20:.0f} MiB.")
+    return removed
+
+
+def _account_local_write(size):
+    global _local_cache_bytes
+    with _local_cache_lock:
+        if _local_cache_bytes is None:
+            _local_cache_bytes = sum(entry_size for _, entry_size, _ in _local_cache_entries())
+        else:
+            _local_cache_bytes += size
+        if _local_cache_bytes > config.THUMBNAIL_LOCAL_CACHE_MAX_BYTES:
+            trim_local_cache()
+
+
+def render_derivative(image_bytes, max_side):
+    """Redimensiona y recomprime una imagen a JPEG con el lado mayor limitado a `max_side`."""
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        # Las fotos de móvil guardan la rotación en EXIF: la aplicamos antes de perderla
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_side, max_side))
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        output = io.BytesIO()
+        image.save(output, format="JPEG", quality=config.THUMBNAIL_JPEG_QUALITY, optimize=True, progressive=True)
+    return output.getvalue()
+
+
+def get_derivative_path(bucket, source_blob, variant, corpus=None):
+    """
+    Devuelve la ruta local de un derivado, buscándolo por orden en la caché
+    local, en GCS y, si no existe, generándolo a partir del original.
+    """
+    derivative_name = derivative_blob_name(source_blob, variant, corpus)
+    local_path = _local_cache_path(derivative_name)
+    try:
+        # Marca el uso para el recorte de la caché
+        os.utime(local_path)
+        return local_path
+    except FileNotFoundError:
+        pass
+
+    derivative_blob = bucket.blob(derivative_name)
+    if derivative_blob.exists():
+        data = derivative_blob.download_as_bytes()
+    else:
+        print(f"[THUMBNAILS] Generando '{variant}' para {source_blob.name}")
+        data = render_derivative(source_blob.download_as_bytes(), config.THUMBNAIL_VARIANTS[variant])
+        derivative_blob.upload_from_string(data, content_type="image/jpeg")
+
+    os.makedirs(config.THUMBNAIL_LOCAL_CACHE_DIR, exist_ok=True)
+    tmp_path = f"{local_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, local_path)
+    _account_local_write(len(data))
+    return local_path
+
+
+def generate_missing_derivatives(bucket, corpus=None):
+    """Pre-genera todos los derivados de las imágenes de las carpetas buscables del corpus."""
+    corpus = corpus or get_corpus()
+    generated = 0
+    for folder_prefix in corpus["searchable_folders"]:
+        for blob in bucket.list_blobs(prefix=folder_prefix):
+            if not is_image(blob.name):
+                continue
+            missing = [
+                variant for variant in config.THUMBNAIL_VARIANTS
+                if not bucket.blob(derivative_blob_name(blob, variant, corpus)).exists()
+            ]
+            if not missing:
+                continue
+            try:
+                # Descargamos el original una sola vez para todas las variantes que faltan
+                image_bytes = blob.download_as_bytes()
+                for variant in missing:
+                    data = render_derivative(image_bytes, config.THUMBNAIL_VARIANTS[variant])
+                    bucket.blob(derivative_blob_name(blob, variant, corpus)).upload_from_string(data, content_type="image/jpeg")
+                    generated += 1
+            except Exception as e:
+                print(f"[THUMBNAILS] Error generando derivados para {blob.name}: {e}")
+    print(f"[THUMBNAILS] {generated} derivados nuevos generados.")
+    return generated
+
+
+if __name__ == "__main__":
+    import argparse
+    from google.cloud import storage
+    parser = argparse.ArgumentParser(description="Pre-genera las miniaturas y vistas previas de un corpus.")
+    parser.add_argument("--corpus", default=config.DEFAULT_CORPUS)
+    corpus = get_corpus(parser.parse_args().corpus)
+    generate_missing_derivatives(storage.Client(project=config.PROJECT_ID).bucket(corpus["bucket"]), corpus)
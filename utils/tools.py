@@ -0,0 +1,95 @@
+# tools.py
+"""Herramientas de archivos que ejecuta el agente según la intención detectada."""
+from . import config
+from . import gcs_tools
+from . import thumbnails
+from .corpora import get_corpus
+
+
+def execute_file_search_tool(details, corpus_name=None):
+    """
+    Ejecuta la búsqueda de archivos del corpus y formatea la respuesta.
+    Ahora utiliza directamente la URL pública devuelta por gcs_tools.find_file_in_gcs.
+    """
+    keywords = details.get("file_keywords")
+    if not keywords:
+        return {"type": "error", "content": "El asistente no pudo identificar qué archivo buscas. Por favor, sé más específico (ej: 'CPU.jpeg')."}
+    
+    corpus = get_corpus(corpus_name)
+    try:
+        # find_file_in_gcs ahora devuelve un diccionario con 'url' o una lista de diccionarios, o None
+        files_found = gcs_tools.find_file_in_gcs(keywords, corpus) 
+    except Exception as e:
+        return {"type": "error", "content": f"Hubo un problema técnico al buscar archivos: {e}"}
+
+    if not files_found:
+        return {"type": "message", "content": f"Lo siento, no encontré ningún archivo que coincida con '{keywords}'."}
+
+    # Si find_file_in_gcs devuelve un solo archivo (diccionario)
+    if isinstance(files_found, dict):
+        file = files_found
+        # Se asume que file['url'] ya contiene la URL firmada del original
+        if thumbnails.is_image(file["name"]):
+            # En el chat se muestra la variante reducida; el original queda detrás del enlace
+            try:
+                bucket = gcs_tools.storage_client.bucket(corpus["bucket"])
+                source_blob = bucket.get_blob(file["path"])
+                preview = thumbnails.get_derivative_path(bucket, source_blob, config.CHAT_IMAGE_VARIANT, corpus)
+            except Exception as e:
+                print(f"No se pudo generar la vista previa de {file['path']}: {e}")
+                preview = file["url"]
+            return {"type": "image", "content": preview, "caption": file["name"], "original_url": file["url"]}
+        else:
+            return {"type": "link", "content": f"He encontrado el archivo: [{file['name']}]({file['url']})"}
+    
+    # Si find_file_in_gcs devuelve múltiples archivos (lista de diccionarios)
+    elif isinstance(files_found, list):
+        links = []
+        for f in files_found:
+            # Cada 'f' ya es un diccionario con 'name', 'path', y 'url'
+            links.append(f"- [{f['name']}]({f['url']})")
+        
+        response_message = f"He encontrado {len(links)} archivos que coinciden con '{keywords}'. Aquí los tienes:\n\n" + "\n".join(links)
+        return {"type": "message", "content": response_message}
+    else:
+        return {"type": "error", "content": "Formato de respuesta inesperado de la herramienta de búsqueda de archivos."}
+
+
+def execute_list_files_in_folder_tool(details, page_token=None, corpus_name=None):
+    """
+    Ejecuta la herramienta para listar archivos dentro de una carpeta específica del corpus.
+    Devuelve una sola página; si hay más archivos, 'next_page_token' permite pedir la siguiente.
+    """
+    folder_name = details.get("folder_name")
+    if not folder_name:
+        return {"type": "error", "content": "El asistente no pudo identificar el nombre de la carpeta para listar archivos."}
+
+    try:
+        corpus = get_corpus(corpus_name)
+        files, next_page_token = gcs_tools.list_files_in_specific_folder(folder_name, page_token=page_token, corpus=corpus)
+    except Exception as e:
+        return {"type": "error", "content": f"Hubo un problema técnico al listar archivos en '{folder_name}': {e}"}
+
+    if not files:
+        if page_token:
+            return {"type": "message", "content": f"No hay más archivos en la carpeta '{folder_name}'."}
+        return {"type": "message", "content": f"Lo siento, no encontré ningún archivo en la carpeta '{folder_name}'."}
+
+    # Generar una lista de enlaces usando las URLs firmadas que ya vienen en 'files'
+    links = []
+    for f in files:
+        # 'f' ya es un diccionario con 'name', 'path', y 'url'
+        links.append(f"- [{f['name']}]({f['url']})")
+
+    if page_token:
+        header = f"Más archivos de la categoría '{folder_name}':"
+    else:
+        header = f"Aquí tienes los archivos que encontré en la categoría '{folder_name}':"
+    response_message = header + "\n\n" + "\n".join(links)
+    return {
+        "type": "file_list",
+        "content": response_message,
+        "folder_name": folder_name,
+        "corpus": corpus["name"],
+        "next_page_token": next_page_token,
+    }